@@ -0,0 +1,247 @@
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import combinations_with_replacement, product, repeat
+
+import numpy as np
+
+from jaipur import *
+
+
+@lru_cache(maxsize=1 << 14)
+def sub_multisets(counts, max_size):
+    # Every sub-multiset of up to max_size cards of a count vector (bytes), grouped by size,
+    # as (bitmask of commodities used, sorted tuple of cards)
+    partial = [(0, 0, ())]
+    for c in range(N_COMMODITIES):
+        if not counts[c]:
+            continue
+
+        extended = []
+        for size, mask, cards in partial:
+            for n in range(1, min(counts[c], max_size - size) + 1):
+                extended.append((size + n, mask | (1 << c), cards + (c,) * n))
+        partial += extended
+
+    by_size = [[] for i in range(max_size + 1)]
+    for size, mask, cards in partial:
+        by_size[size].append((mask, cards))
+    # Tuples all the way down, so cached results are not tracked by the garbage collector
+    return tuple(tuple(i) for i in by_size)
+
+
+@lru_cache(maxsize=1 << 12)
+def grouped_sub_multisets(counts, max_size):
+    # Same as sub_multisets, with the sub-multisets of each size grouped by commodities used
+    by_size = []
+    for subsets in sub_multisets(counts, max_size):
+        groups = {}
+        for mask, cards in subsets:
+            groups.setdefault(mask, []).append(cards)
+        by_size.append(tuple((mask, tuple(group)) for mask, group in groups.items()))
+    return tuple(by_size)
+
+
+TAKE, SELL, TRADE = (int(i) for i in Action)
+
+# Camels only ever appear on the give side of a trade, as a prefix of the sorted cards
+CAMELS = [(int(Commodity.CAMEL),) * i for i in range(MAX_HAND_SIZE + 1)]
+
+
+def possible_trades(hand, market):
+    # Trades of two or more cards from hand (camels included) against as many goods from
+    # the market, never giving and taking the same commodity
+    goods = bytearray(market)
+    goods[Commodity.CAMEL] = 0
+    hand_goods = bytearray(hand)
+    hand_goods[Commodity.CAMEL] = 0
+    camels = hand[Commodity.CAMEL]
+
+    max_size = min(sum(hand), sum(goods))
+    if max_size < 2:
+        return []
+
+    # Goods-only sub-multisets repeat far more often than whole hands with their camels
+    gives = sub_multisets(bytes(hand_goods), max_size)
+    takes = grouped_sub_multisets(bytes(goods), max_size)
+
+    trades = []
+    for size in range(2, max_size + 1):
+        for take_mask, group in takes[size]:
+            allowed = [CAMELS[i] + give
+                       for i in range(min(camels, size) + 1)
+                       for give_mask, give in gives[size - i]
+                       if not give_mask & take_mask]
+            trades += product(allowed, group)
+    return trades
+
+
+def generate_actions(hand, market):
+    # Actions hold plain ints rather than Action/Commodity members (they compare and print
+    # the same) so the garbage collector can untrack the cached tuples
+    all_actions = []
+    if sum(hand) - hand[Commodity.CAMEL] < MAX_HAND_SIZE:
+        all_actions += [(TAKE, i) for i in range(N_COMMODITIES) if market[i] > 0]
+
+    # Precious goods can only be sold two or more at a time
+    for commodity in range(1, N_COMMODITIES):
+        for i in range(PRECIOUS[commodity], hand[commodity]):
+            all_actions += [(SELL, commodity, i + 1)]
+
+    all_actions += zip(repeat(TRADE), possible_trades(hand, market))
+    return tuple(all_actions)
+
+
+class ActionCache:
+    # LRU cache of legal actions keyed on the packed (hand, camels, market) bytes.
+    # Cached tuples are shared between callers and must not be modified.
+
+    def __init__(self, maxsize=1 << 16):
+        self.maxsize = maxsize
+        self._actions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, hand, market):
+        # hand and market are byte vectors: bytearray, bytes or int8/uint8 arrays
+        key = bytes(hand) + bytes(market)
+        actions = self._actions.get(key)
+        if actions is not None:
+            self.hits += 1
+            try:
+                self._actions.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread (bots of the game server) since the lookup
+                pass
+            return actions
+
+        self.misses += 1
+        actions = generate_actions(key[:N_COMMODITIES], key[N_COMMODITIES:])
+        self._actions[key] = actions
+        if len(self._actions) > self.maxsize:
+            self._actions.popitem(last=False)
+            self.evictions += 1
+        return actions
+
+    def clear(self):
+        self._actions.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._actions),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+ACTION_CACHE = ActionCache()
+
+
+# Fixed action space: every take, sell and trade that can ever be legal, numbered in a
+# fixed order (takes, sells by commodity and count, trades by size, give and take cards).
+# Trades never involve more than the 5 cards of the market.
+MAX_TRADE_SIZE = 5
+
+
+def enumerate_actions():
+    space = [(TAKE, i) for i in range(N_COMMODITIES)]
+    for commodity in range(1, N_COMMODITIES):
+        for n in range(PRECIOUS[commodity] + 1, CARD_TOTALS[commodity] + 1):
+            space.append((SELL, commodity, n))
+    for size in range(2, MAX_TRADE_SIZE + 1):
+        for give in combinations_with_replacement(range(N_COMMODITIES), size):
+            for take in combinations_with_replacement(range(1, N_COMMODITIES), size):
+                if not set(give) & set(take):
+                    space.append((TRADE, (give, take)))
+    return tuple(space)
+
+
+ACTION_SPACE = enumerate_actions()
+N_ACTIONS = len(ACTION_SPACE)
+ACTION_IDS = {action: i for i, action in enumerate(ACTION_SPACE)}
+
+def decode_tables():
+    # Per action id, in the layout of the batched actions of batch.py: kind, commodity
+    # (takes and sells), count (sells), and the give and take count vectors of trades
+    kind = np.zeros(N_ACTIONS, dtype=np.int8)
+    commodity = np.zeros(N_ACTIONS, dtype=np.int8)
+    count = np.zeros(N_ACTIONS, dtype=np.int8)
+    give = np.zeros((N_ACTIONS, N_COMMODITIES), dtype=np.int8)
+    take = np.zeros((N_ACTIONS, N_COMMODITIES), dtype=np.int8)
+    for i, action in enumerate(ACTION_SPACE):
+        kind[i] = action[0]
+        if action[0] == TRADE:
+            for c in action[1][0]:
+                give[i, c] += 1
+            for c in action[1][1]:
+                take[i, c] += 1
+        else:
+            commodity[i] = action[1]
+            if action[0] == SELL:
+                count[i] = action[2]
+    return kind, commodity, count, give, take
+
+
+ACTION_KIND, ACTION_COMMODITY, ACTION_COUNT, ACTION_GIVE, ACTION_TAKE = decode_tables()
+
+
+def action_ids(actions):
+    return np.fromiter(map(ACTION_IDS.__getitem__, actions), dtype=np.int32, count=len(actions))
+
+
+def decode_actions(ids):
+    # The (kind, commodity, count, give, take) arrays of action ids
+    return ACTION_KIND[ids], ACTION_COMMODITY[ids], ACTION_COUNT[ids], ACTION_GIVE[ids], ACTION_TAKE[ids]
+
+
+@lru_cache(maxsize=1 << 16)
+def _legal_ids(key):
+    # Straight from generate_actions: callers of the ids never need ACTION_CACHE's tuples
+    ids = action_ids(generate_actions(key[:N_COMMODITIES], key[N_COMMODITIES:]))
+    ids.flags.writeable = False
+    return ids
+
+
+def legal_ids(hand, market):
+    # Ids of the legal actions in get_all_actions order, as a shared read-only array
+    return _legal_ids(bytes(hand) + bytes(market))
+
+
+def legal_mask(hand, market):
+    # Boolean mask over ACTION_SPACE of the legal actions
+    mask = np.zeros(N_ACTIONS, dtype=bool)
+    mask[legal_ids(hand, market)] = True
+    return mask
+
+
+# The action space is laid out as takes, sells, then trades. Trades pair every give vector
+# with every allowed take vector, so batched masks check the distinct vectors once each
+# and gather them per trade.
+SELLS = slice(N_COMMODITIES, int(np.flatnonzero(ACTION_KIND == TRADE)[0]))
+TRADES = slice(SELLS.stop, N_ACTIONS)
+GIVE_VECTORS, GIVE_INDEX = np.unique(ACTION_GIVE[TRADES], axis=0, return_inverse=True)
+TAKE_VECTORS, TAKE_INDEX = np.unique(ACTION_TAKE[TRADES], axis=0, return_inverse=True)
+
+
+def legal_masks(hands, markets):
+    # Masks of a batch of states at once, from (m, N_COMMODITIES) hands (camels included)
+    # and markets: row i is legal_mask(hands[i], markets[i]), without building any action.
+    # Rows are gathered action by action, so the result is the transpose of an
+    # (N_ACTIONS, m) array.
+    hands = np.asarray(hands, dtype=np.int8)
+    markets = np.asarray(markets, dtype=np.int8)
+    masks = np.empty((N_ACTIONS, len(hands)), dtype=bool)
+
+    can_take = hands[:, 1:].sum(axis=1) < MAX_HAND_SIZE
+    masks[:N_COMMODITIES] = (markets > 0).T & can_take
+    masks[SELLS] = hands.T[ACTION_COMMODITY[SELLS]] >= ACTION_COUNT[SELLS, None]
+
+    gives = (GIVE_VECTORS[:, None, :] <= hands[None, :, :]).all(axis=2)
+    takes = (TAKE_VECTORS[:, None, :] <= markets[None, :, :]).all(axis=2)
+    np.logical_and(gives[GIVE_INDEX], takes[TAKE_INDEX], out=masks[TRADES])
+    return masks.T
@@ -0,0 +1,364 @@
+from operator import getitem
+
+import numpy as np
+
+from jaipur import *
+from actions import *
+
+# Padded token stacks and their prefix sums: selling m tokens from a stack of depth L
+# is worth TOKEN_PREFIX[c, L] - TOKEN_PREFIX[c, L - m]
+STACK_DEPTH = max(len(i) for i in PRICE_TOKENS)
+TOKEN_PREFIX = np.zeros((N_COMMODITIES, STACK_DEPTH + 1), dtype=np.int16)
+TOP_TOKEN = np.zeros((N_COMMODITIES, STACK_DEPTH + 1), dtype=np.int16)
+for i in COMMODITIES:
+    TOKEN_PREFIX[i, 1:len(PRICE_TOKENS[i]) + 1] = np.cumsum(PRICE_TOKENS[i], dtype=np.int16)
+    TOP_TOKEN[i, 1:len(PRICE_TOKENS[i]) + 1] = PRICE_TOKENS[i]
+PRECIOUS_MASK = np.array(PRECIOUS, dtype=np.int8)
+
+# Bonus piles padded to the same depth
+BONUS_DEPTH = max(len(i) for i in BONUS_TOKENS)
+BONUS_PILES = np.zeros((len(BONUS_TOKENS), BONUS_DEPTH), dtype=np.int16)
+for k, pile in enumerate(BONUS_TOKENS):
+    BONUS_PILES[k, :len(pile)] = pile
+
+MAX_GIVE = MAX_HAND_SIZE + DECK.count(Commodity.CAMEL) + 3
+MAX_TAKE = 5
+
+
+def expand(counts, width):
+    # Turns (m, N_COMMODITIES) count vectors into (m, width) card lists padded with -1
+    cum = np.cumsum(counts, axis=1)
+    cards = (cum[:, None, :] <= np.arange(width)[None, :, None]).sum(axis=2)
+    cards[np.arange(width)[None, :] >= cum[:, -1:]] = -1
+    return cards
+
+
+def encode_actions(actions):
+    # Converts Player.get_all_actions style tuples into the batched action arrays
+    m = len(actions)
+    kind = np.zeros(m, dtype=np.int8)
+    commodity = np.zeros(m, dtype=np.int8)
+    count = np.zeros(m, dtype=np.int8)
+    give = np.zeros((m, N_COMMODITIES), dtype=np.int8)
+    take = np.zeros((m, N_COMMODITIES), dtype=np.int8)
+
+    for i, action in enumerate(actions):
+        kind[i] = action[0]
+        if action[0] == Action.TAKE:
+            commodity[i] = action[1]
+        elif action[0] == Action.SELL:
+            commodity[i] = action[1]
+            count[i] = action[2]
+        else:
+            for c in action[1][0]:
+                give[i, c] += 1
+            for c in action[1][1]:
+                take[i, c] += 1
+
+    return kind, commodity, count, give, take
+
+
+class BatchJaipur:
+    # N games held as arrays and advanced in lockstep, so every unfinished game has the
+    # same side to move. Actions are given as five arrays (kind, commodity, count, give, take)
+    # with one row per unfinished game; give and take are count vectors used by trades.
+
+    def __init__(self, n, seed=None):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+
+        self.tokens_left = np.tile(np.array([len(i) for i in PRICE_TOKENS], dtype=np.int8), (n, 1))
+        self.empty_stacks = np.zeros(n, dtype=np.int8)
+
+        self.deck = self.rng.permuted(np.tile(np.frombuffer(DECK, dtype=np.int8), (n, 1)), axis=1)
+        self.deck_size = np.full(n, len(DECK), dtype=np.int8)
+
+        # bonus[:, k, :bonus_left[:, k]] are the tokens left in bonus pile k, drawn from the end
+        self.bonus = np.zeros((n, len(BONUS_TOKENS), BONUS_DEPTH), dtype=np.int16)
+        for k, pile in enumerate(BONUS_TOKENS):
+            self.bonus[:, k, :len(pile)] = self.rng.permuted(np.tile(BONUS_PILES[k, :len(pile)], (n, 1)), axis=1)
+        self.bonus_left = np.tile(np.array([len(i) for i in BONUS_TOKENS], dtype=np.int8), (n, 1))
+
+        self.market = np.zeros((n, N_COMMODITIES), dtype=np.int8)
+        self.market[:, Commodity.CAMEL] = 3
+        self.market_size = np.full(n, 3, dtype=np.int8)
+
+        # hands[:, p, CAMEL] is the herd of player p, hand_size counts goods only
+        self.hands = np.zeros((n, 2, N_COMMODITIES), dtype=np.int8)
+        self.hand_size = np.zeros((n, 2), dtype=np.int8)
+        self.points = np.zeros((n, 2), dtype=np.int16)
+
+        self.final_score = np.zeros((n, 2), dtype=np.int16)
+        self.winner = np.full(n, -1, dtype=np.int8)
+        self.done = np.zeros(n, dtype=bool)
+        self.turn = 0
+        self.plies = 0
+
+        rows = np.arange(n)
+        self.refill(rows, np.full(n, 2, dtype=np.int8))
+
+        # Deal 5 cards to each player
+        for i in range(5):
+            for p in range(2):
+                card = self.draw(rows)
+                self.hands[rows, p, card] += 1
+                self.hand_size[rows, p] += card != Commodity.CAMEL
+
+    @classmethod
+    def from_games(cls, games):
+        # Loads Jaipur instances, keeping their decks, into a batch. The unfinished ones must
+        # have the same side to move.
+        turns = {0 if game.player_turn is game._player1 else 1 for game in games if game.winner is None}
+        if len(turns) > 1:
+            raise ValueError('unfinished games must have the same player to move')
+
+        batch = cls(len(games))
+        for i, game in enumerate(games):
+            batch.market[i] = np.frombuffer(game.market, dtype=np.int8)
+            batch.market_size[i] = game.market_size
+            batch.tokens_left[i] = np.frombuffer(game.tokens_left, dtype=np.int8)
+            batch.empty_stacks[i] = game.empty_stacks
+            batch.deck[i] = np.frombuffer(game._deck, dtype=np.int8)
+            batch.deck_size[i] = game.deck_size
+            for k, pile in enumerate(game._bonus):
+                batch.bonus[i, k, :len(pile)] = np.frombuffer(pile, dtype=np.uint8)
+            batch.bonus_left[i] = np.frombuffer(game.bonus_left, dtype=np.int8)
+            for p, player in enumerate((game._player1, game._player2)):
+                batch.hands[i, p] = np.frombuffer(player.hand, dtype=np.int8)
+                batch.hand_size[i, p] = player.hand_size()
+                batch.points[i, p] = player.score()
+                batch.final_score[i, p] = player.final_score
+            if game.winner is not None:
+                batch.winner[i] = 0 if game.winner == game._player1.tag else 1
+                batch.done[i] = True
+        batch.turn = turns.pop() if turns else 0
+        return batch
+
+    def active(self):
+        return np.flatnonzero(~self.done)
+
+    def draw(self, rows):
+        self.deck_size[rows] -= 1
+        return self.deck[rows, self.deck_size[rows]]
+
+    def refill(self, rows, count):
+        count = np.minimum(count, self.deck_size[rows])
+        for i in range(int(count.max(initial=0))):
+            drawing = rows[count > i]
+            self.market[drawing, self.draw(drawing)] += 1
+        self.market_size[rows] += count
+
+    def take(self, rows, commodity):
+        p = self.turn
+        # When player takes camel, all camels in market must be taken
+        camel = commodity == Commodity.CAMEL
+        count = np.where(camel, self.market[rows, Commodity.CAMEL], 1).astype(np.int8)
+
+        self.market[rows, commodity] -= count
+        self.market_size[rows] -= count
+        self.hands[rows, p, commodity] += count
+        self.hand_size[rows, p] += np.where(camel, 0, count).astype(np.int8)
+        self.refill(rows, count)
+
+    def sell(self, rows, commodity, count):
+        p = self.turn
+        self.hands[rows, p, commodity] -= count
+        self.hand_size[rows, p] -= count
+
+        left = self.tokens_left[rows, commodity]
+        paid = np.minimum(count, left)
+        self.points[rows, p] += TOKEN_PREFIX[commodity, left] - TOKEN_PREFIX[commodity, left - paid]
+        self.tokens_left[rows, commodity] = left - paid
+        self.empty_stacks[rows] += (left > 0) & (left == paid)
+
+        pile = np.clip(count, 3, 5) - 3
+        left = self.bonus_left[rows, pile]
+        paid = (count >= 3) & (left > 0)
+        self.points[rows, p] += np.where(paid, self.bonus[rows, pile, np.maximum(left - 1, 0)], 0).astype(np.int16)
+        self.bonus_left[rows, pile] = left - paid
+
+    def trade(self, rows, give, take):
+        p = self.turn
+        self.hands[rows, p] += take - give
+        self.market[rows] += give - take
+        # Goods received replace goods given, camels given grow the hand
+        self.hand_size[rows, p] += give[:, Commodity.CAMEL]
+
+    def game_winner(self, rows):
+        # End game if 3 resources are sold completely
+        # Or if market goes less than 5
+        ended = rows[(self.empty_stacks[rows] >= 3) | (self.market_size[rows] < 5)]
+
+        final = self.points[ended].copy()
+        camels = self.hands[ended, :, Commodity.CAMEL]
+        final[:, 0] += 5 * (camels[:, 0] > camels[:, 1])
+        final[:, 1] += 5 * (camels[:, 0] < camels[:, 1])
+
+        self.final_score[ended] = final
+        self.winner[ended] = np.where(final[:, 0] > final[:, 1], 0, 1) #TODO tie breaker, same as Jaipur
+        self.done[ended] = True
+
+    def step(self, strategy):
+        rows = self.active()
+        if not len(rows):
+            return rows
+
+        kind, commodity, count, give, take = strategy.choose_actions(self, rows)
+
+        taking = kind == Action.TAKE
+        self.take(rows[taking], commodity[taking])
+
+        selling = kind == Action.SELL
+        self.sell(rows[selling], commodity[selling], count[selling])
+
+        trading = kind == Action.TRADE
+        self.trade(rows[trading], give[trading], take[trading])
+
+        self.game_winner(rows)
+        self.turn ^= 1
+        self.plies += 1
+        return rows
+
+    def play(self, strategy1, strategy2=None):
+        strategies = (strategy1, strategy2 or strategy1)
+        while not self.done.all():
+            self.step(strategies[self.turn])
+        return self.winner
+
+    def legal_masks(self, rows):
+        # Masks over ACTION_SPACE of the legal actions of the side to move in games rows
+        return legal_masks(self.hands[rows, self.turn], self.market[rows])
+
+    def sell_options(self, rows):
+        # Number of legal sell sizes for each good: precious goods sell two or more at a time
+        hand = self.hands[rows, self.turn]
+        options = np.maximum(hand - PRECIOUS_MASK, 0)
+        options[:, Commodity.CAMEL] = 0
+        return options
+
+    def sample_trades(self, rows, tries=4):
+        # Random trades built so they are always legal: pick the cards to take first, then
+        # the same number of cards to give from commodities not being taken.
+        # Rows where no trade was found within tries get ok=False.
+        m = len(rows)
+        hand = self.hands[rows, self.turn]
+        market_goods = self.market[rows].copy()
+        market_goods[:, Commodity.CAMEL] = 0
+
+        give = np.zeros((m, N_COMMODITIES), dtype=np.int8)
+        take = np.zeros((m, N_COMMODITIES), dtype=np.int8)
+        ok = np.zeros(m, dtype=bool)
+
+        give_cards = expand(hand, MAX_GIVE)
+        take_cards = expand(market_goods, MAX_TAKE)
+        n_give = hand.sum(axis=1)
+        n_take = market_goods.sum(axis=1)
+        possible = (n_give >= 2) & (n_take >= 2)
+
+        for i in range(tries):
+            todo = np.flatnonzero(possible & ~ok)
+            if not len(todo):
+                break
+
+            size = self.rng.integers(2, np.minimum(n_give[todo], n_take[todo]) + 1)
+            slots = np.arange(MAX_TAKE)[None, :]
+            order = np.argsort(np.where(take_cards[todo] >= 0, self.rng.random((len(todo), MAX_TAKE)), 2), axis=1)
+            picked = np.take_along_axis(take_cards[todo], order, axis=1)
+            t = np.zeros((len(todo), N_COMMODITIES), dtype=np.int8)
+            np.add.at(t, (np.repeat(np.arange(len(todo)), MAX_TAKE), np.maximum(picked, 0).ravel()), (slots < size[:, None]).ravel())
+
+            allowed = (give_cards[todo] >= 0) & (t[np.arange(len(todo))[:, None], np.maximum(give_cards[todo], 0)] == 0)
+            enough = allowed.sum(axis=1) >= size
+            order = np.argsort(np.where(allowed, self.rng.random((len(todo), MAX_GIVE)), 2), axis=1)
+            picked = np.take_along_axis(give_cards[todo], order, axis=1)
+            g = np.zeros((len(todo), N_COMMODITIES), dtype=np.int8)
+            slots = np.arange(MAX_GIVE)[None, :]
+            np.add.at(g, (np.repeat(np.arange(len(todo)), MAX_GIVE), np.maximum(picked, 0).ravel()), (slots < size[:, None]).ravel())
+
+            found = todo[enough]
+            give[found] = g[enough]
+            take[found] = t[enough]
+            ok[found] = True
+
+        return give, take, ok
+
+
+class BatchStrategy:
+    def choose_actions(self, batch, rows):
+        raise NotImplementedError
+
+
+class RandomBatchStrategy(BatchStrategy):
+    # Uniform over every take and sell option plus a single option standing for "some random trade"
+    def choose_actions(self, batch, rows):
+        m = len(rows)
+        can_take = batch.hand_size[rows, batch.turn] < MAX_HAND_SIZE
+        take_options = (batch.market[rows] > 0) & can_take[:, None]
+        sell_options = batch.sell_options(rows)
+        give, take, can_trade = batch.sample_trades(rows)
+
+        weights = np.concatenate([take_options, sell_options, can_trade[:, None]], axis=1)
+        cum = np.cumsum(weights, axis=1)
+        choice = (cum <= batch.rng.random(m)[:, None] * cum[:, -1:]).sum(axis=1)
+
+        kind = np.where(choice < N_COMMODITIES, Action.TAKE,
+                        np.where(choice < 2 * N_COMMODITIES, Action.SELL, Action.TRADE)).astype(np.int8)
+        commodity = (choice % N_COMMODITIES).astype(np.int8)
+
+        # Sell size uniform among the legal sizes
+        options = sell_options[np.arange(m), commodity]
+        count = PRECIOUS_MASK[commodity] + 1 + (batch.rng.random(m) * options).astype(np.int8)
+        count = np.where(kind == Action.SELL, count, 0).astype(np.int8)
+
+        return kind, commodity, count, give, take
+
+
+class UniformBatchStrategy(BatchStrategy):
+    # Uniform over all legal actions (where RandomBatchStrategy weighs all trades together
+    # as one option). Each game picks from the cached legal_ids of its position: sampling
+    # needs no more, and a legal_masks batch over the whole action space costs far more.
+    def choose_actions(self, batch, rows):
+        legal = [legal_ids(hand, market) for hand, market in zip(batch.hands[rows, batch.turn], batch.market[rows])]
+        counts = np.fromiter(map(len, legal), dtype=np.int64, count=len(rows))
+        picks = (batch.rng.random(len(rows)) * counts).astype(np.int64)
+        return decode_actions(np.fromiter(map(getitem, legal, picks), dtype=np.int32, count=len(rows)))
+
+
+class GreedyBatchStrategy(BatchStrategy):
+    # Sells a full set of 3+ goods (2+ for precious ones) at the best current price,
+    # otherwise takes the most valuable good, otherwise takes camels,
+    # and with a full hand sells whatever is worth most
+    def choose_actions(self, batch, rows):
+        m = len(rows)
+        hand = batch.hands[rows, batch.turn].astype(np.int16)
+        market = batch.market[rows]
+        top = TOP_TOKEN[np.arange(N_COMMODITIES)[None, :], batch.tokens_left[rows]]
+
+        sellable = batch.sell_options(rows) > 0
+        sale_value = np.where(sellable, hand * np.maximum(top, 1), -1)
+        best_sale = sale_value.argmax(axis=1)
+        good_set = np.take_along_axis(hand >= 3 - PRECIOUS_MASK, best_sale[:, None], axis=1)[:, 0]
+        good_set &= np.take_along_axis(sellable, best_sale[:, None], axis=1)[:, 0]
+
+        goods_value = np.where(market > 0, top + 1, 0)
+        goods_value[:, Commodity.CAMEL] = 0
+        best_good = goods_value.argmax(axis=1)
+        has_good = goods_value.max(axis=1) > 0
+        can_take = batch.hand_size[rows, batch.turn] < MAX_HAND_SIZE
+
+        take_camels = market[:, Commodity.CAMEL] >= 3
+        take_good = can_take & has_good & ~take_camels
+        take_camels &= can_take
+        take_any = can_take & ~take_good & ~take_camels
+
+        kind = np.full(m, Action.SELL, dtype=np.int8)
+        commodity = best_sale.astype(np.int8)
+        kind[~good_set & (take_good | take_camels | take_any)] = Action.TAKE
+        taking = kind == Action.TAKE
+        commodity[taking & take_good] = best_good[taking & take_good]
+        commodity[taking & take_camels] = Commodity.CAMEL
+        commodity[taking & take_any] = (market[taking & take_any] > 0).argmax(axis=1)
+
+        count = np.where(kind == Action.SELL, np.take_along_axis(hand, best_sale[:, None], axis=1)[:, 0], 0).astype(np.int8)
+        empty = np.zeros((m, N_COMMODITIES), dtype=np.int8)
+        return kind, commodity, count, empty, empty
@@ -0,0 +1,189 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+from jaipur import *
+from player import *
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+TOLERANCE = 0.25
+
+
+def timed(fn, number, repeat=5):
+    # Best time per call over `repeat` runs of `number` calls, with the garbage collector
+    # off like timeit
+    best = float('inf')
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for r in range(repeat):
+            start = time.perf_counter()
+            for i in range(number):
+                fn()
+            best = min(best, (time.perf_counter() - start) / number)
+    finally:
+        if enabled:
+            gc.enable()
+    return best
+
+
+def new_game(seed=0):
+    strategy = RandomPlayerStrategy()
+    return Jaipur(lambda tag, game: Player(strategy, tag, game),
+                  lambda tag, game: Player(strategy, tag, game),
+                  muted=True, seed=seed)
+
+
+# Card spelling used by position
+INITIALS = {'c': Commodity.CAMEL, 'L': Commodity.LEATHER, 'S': Commodity.SPICE, 's': Commodity.SILK,
+            'V': Commodity.SILVER, 'G': Commodity.GOLD, 'D': Commodity.DIAMOND}
+
+
+def position(hand, camels, market):
+    # A game with the given goods in hand, herd and market, cards spelled with INITIALS
+    game = new_game()
+
+    player = game.player_turn
+    player.hand[:] = bytes(N_COMMODITIES)
+    for i in hand:
+        player.hand[INITIALS[i]] += 1
+    player.hand[Commodity.CAMEL] = camels
+    player._hand_size = len(hand)
+
+    game.market[:] = bytes(N_COMMODITIES)
+    for i in market:
+        game.market[INITIALS[i]] += 1
+    game.market_size = len(market)
+    game.zobrist = game.compute_zobrist()
+    return game
+
+
+# (hand, camels, market)
+POSITIONS = {
+    'small': ('LS', 0, 'cccLS'),
+    'typical': ('LLSGD', 2, 'cLSsG'),
+    'full_hand': ('LLSSGGD', 3, 'cLsVD'),
+    'camel_herd': ('LSG', 8, 'LSsVD'),
+    'worst_trades': ('LSsVGDD', 7, 'LSsVG'),
+}
+
+
+def bench_games():
+    # New deals on every run, so the action cache is as warm as in a long self-play run
+    # but does not already hold every position
+    games = 200
+    seeds = iter(range(10 ** 9))
+
+    def run():
+        for g in range(games):
+            game = new_game(next(seeds))
+            while game.winner is None:
+                game = game.switch_player()
+                game.game_winner()
+
+    run()
+    return timed(run, 1, 3) / games
+
+
+def bench_get_all_actions(hand, camels, market, cached):
+    game = position(hand, camels, market)
+    player = game.player_turn
+
+    if cached:
+        player.get_all_actions()
+        return timed(player.get_all_actions, 2000)
+
+    def uncached():
+        ACTION_CACHE.clear()
+        sub_multisets.cache_clear()
+        grouped_sub_multisets.cache_clear()
+        player.get_all_actions()
+    return timed(uncached, 200)
+
+
+def bench_possible_trades(hand, camels, market):
+    game = position(hand, camels, market)
+    player = game.player_turn
+    give = [i for i in COMMODITIES for n in range(player.hand[i])]
+    take = [i for i in COMMODITIES for n in range(game.market[i]) if i != Commodity.CAMEL]
+    return timed(lambda: player.get_possible_trades(give, take), 500)
+
+
+def bench_pick_commodity():
+    game = new_game()
+    commodities = [i for i in COMMODITIES if game.market[i]]
+    state = bytes(game.market), game.market_size, game.deck_size, game.zobrist
+
+    def pick():
+        for i in commodities:
+            game.pick_commodity(i)
+            game.market[:], game.market_size, game.deck_size, game.zobrist = state
+    return timed(pick, 2000) / len(commodities)
+
+
+def bench_game_winner():
+    game = new_game()
+    for i in range(10):
+        game = game.switch_player()
+        if game.game_winner() is not None:
+            break
+    game.winner = None
+    return timed(game.game_winner, 20000)
+
+
+def run_benchmarks():
+    results = {'games': bench_games(), 'pick_commodity': bench_pick_commodity(), 'game_winner': bench_game_winner()}
+    for name, (hand, camels, market) in POSITIONS.items():
+        results['get_all_actions.%s' % name] = bench_get_all_actions(hand, camels, market, True)
+        results['get_all_actions.%s.uncached' % name] = bench_get_all_actions(hand, camels, market, False)
+        results['get_possible_trades.%s' % name] = bench_possible_trades(hand, camels, market)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Names of the benchmarks slower than baseline by more than tolerance
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        base = baseline.get(name)
+        ratio = seconds / base if base else float('nan')
+        flag = ''
+        if base and ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('%-40s %12.2f us %8.2fx%s' % (name, seconds * 1e6, ratio, flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    # python bench.py                  compare against bench_baseline.json, exit 1 on regressions
+    # python bench.py --save           store the results as the new baseline
+    # python bench.py --json out.json  also write the results
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--json')
+    args = parser.parse_args()
+
+    results = run_benchmarks()
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'seconds': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        compare(results, results, args.tolerance)
+        sys.exit(0)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['seconds']
+    except FileNotFoundError:
+        baseline = {}
+    sys.exit(1 if compare(results, baseline, args.tolerance) else 0)
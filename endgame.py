@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from jaipur import *
+from player import *
+from values import *
+from mcts import detached
+from search import terminal_value, top_card_expectation
+
+
+class EndgameTooLarge(Exception):
+    pass
+
+
+class EndgameTable:
+    # Solved endgame values by table_key, stored as a ValueTable file at path (12 bytes a
+    # position, mapped rather than read) with the max_trades of the solver that filled it in
+    # path + '.json'. Values depend on max_trades, so opening a table for another one is an
+    # error. Positions solved since the table was opened are kept in values until save().
+
+    def __init__(self, path=None, max_trades=1):
+        self.path = path
+        self.max_trades = max_trades
+        self.values = {}
+        self.stored = None
+        if path is not None and os.path.exists(path):
+            with open(path + '.json') as f:
+                stored_trades = json.load(f)['max_trades']
+            if stored_trades != max_trades:
+                raise ValueError('%s was solved with max_trades=%d, not %d' % (path, stored_trades, max_trades))
+            self.stored = ValueTable(path)
+
+    def __len__(self):
+        return len(self.values) + (len(self.stored) if self.stored is not None else 0)
+
+    def get(self, key):
+        value = self.values.get(key)
+        if value is None and self.stored is not None:
+            value = self.stored.get(key)
+        return value
+
+    def save(self, path=None):
+        # Writes the stored and the new values to a new file, replacing the old one
+        path = path or self.path
+        keys = np.fromiter(self.values, dtype=np.uint64, count=len(self.values))
+        values = np.fromiter(self.values.values(), dtype=np.float32, count=len(self.values))
+        if self.stored is not None:
+            stored_keys, stored_values = self.stored.items()
+            keys = np.concatenate([stored_keys, keys])
+            values = np.concatenate([stored_values, values])
+
+        capacity = 1 << max(10, int(len(keys) / MAX_LOAD * 2).bit_length())
+        table = ValueTable.create(path + '.tmp', capacity)
+        table.set(keys, values)
+        table.flush()
+        del table
+        with open(path + '.json', 'w') as f:
+            json.dump({'max_trades': self.max_trades, 'positions': len(keys)}, f)
+        os.replace(path + '.tmp', path)
+
+        self.path = path
+        self.stored = ValueTable(path)
+        self.values = {}
+
+
+def position_key(game):
+    # Everything the rest of the game depends on, from the side of the player to move:
+    # market, both hands, token stacks, and what is left in the deck and the bonus piles
+    # (as multisets, the order is unknown). Scores so far are left out, values are margins.
+    player = game.player_turn
+    key = game.market + player.hand + game.opponent().hand + game.tokens_left
+    key.append(game.deck_size)
+    key += bytes(sorted(game._deck[:game.deck_size]))
+    for pile, left in zip(game._bonus, game.bonus_left):
+        key.append(left)
+        key += bytes(sorted(pile[:left]))
+    return bytes(key)
+
+
+def table_key(game, trades):
+    # 64-bit hash of the position key and the number of trades in a row, never 0 (the
+    # empty slot of a ValueTable)
+    digest = hashlib.blake2b(position_key(game) + bytes((trades,)), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class EndgameSolver:
+    # Exact values of late positions: the expected number of points the player to move will
+    # still gain minus the opponent's (camel bonus included) when both play perfectly.
+    # Cards drawn from the deck and bonus tokens are chance nodes over what is left in
+    # them, enumerated exactly, so every value is an exact expectation. Like the expectimax
+    # search the solver sees both hands.
+    #
+    # Trades alone never end the game and can go round in circles, so at most max_trades
+    # trades are played in a row (by either player) before a sale or a take. Every other
+    # move sells cards for good or draws from the deck, so the solved game has no cycles
+    # and ends. The number of trades in a row is part of a position's key in the table, and
+    # the table must have been made for the same max_trades.
+    # A solve gives up with EndgameTooLarge after max_nodes new positions.
+
+    def __init__(self, table=None, max_trades=1, max_nodes=200000):
+        self.table = table if table is not None else EndgameTable(max_trades=max_trades)
+        if self.table.max_trades != max_trades:
+            raise ValueError('table is for max_trades=%d, not %d' % (self.table.max_trades, max_trades))
+        self.max_trades = max_trades
+        self.max_nodes = max_nodes
+        self.nodes = 0
+
+    def value(self, game, trades=0):
+        self.nodes = 0
+        return self.solve(self.copy(game), trades)
+
+    def action_values(self, game, trades=0):
+        # {action: value} for the player to move
+        game = self.copy(game)
+        self.nodes = 0
+        return {action: self.action_value(game, action, trades) for action in self.actions(game, trades)}
+
+    def best_action(self, game, trades=0):
+        values = self.action_values(game, trades)
+        action = max(values, key=values.get)
+        return action, values[action]
+
+    def copy(self, game):
+        game = detached(game)
+        game.muted = True
+        return game
+
+    def actions(self, game, trades):
+        actions = game.player_turn.get_all_actions()
+        if trades >= self.max_trades:
+            moves = [action for action in actions if action[0] != Action.TRADE]
+            if moves:
+                return moves
+        return actions
+
+    def solve(self, game, trades):
+        if game.winner is not None:
+            return terminal_value(game)
+
+        key = table_key(game, trades)
+        value = self.table.get(key)
+        if value is not None:
+            return value
+
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise EndgameTooLarge
+
+        value = max(self.action_value(game, action, trades) for action in self.actions(game, trades))
+        self.table.values[key] = value
+        return value
+
+    def action_value(self, game, action, trades):
+        # Expected value of action, over the cards it draws and the bonus token it earns
+        draws = 0
+        if action[0] == Action.TAKE:
+            draws = game.market[Commodity.CAMEL] if action[1] == Commodity.CAMEL else 1
+            draws = min(draws, game.deck_size)
+
+        pile = None
+        if action[0] == Action.SELL and action[2] >= 3 and game.bonus_left[bonus_pile(action[2])]:
+            pile = bonus_pile(action[2])
+
+        trades = trades + 1 if action[0] == Action.TRADE else 0
+        return self.chance(game, action, trades, draws, game.deck_size - 1, pile)
+
+    def chance(self, game, action, trades, draws, top, pile):
+        # Fixes the cards action draws one at a time, top of the deck first (positions top,
+        # top - 1, ...), then the bonus token at the top of its pile, then plays action
+        if draws:
+            return top_card_expectation(game._deck, top + 1,
+                                        lambda: self.chance(game, action, trades, draws - 1, top - 1, pile))
+        if pile is not None:
+            return top_card_expectation(game._bonus[pile], game.bonus_left[pile],
+                                        lambda: self.chance(game, action, trades, 0, 0, None))
+
+        player = game.player_turn
+        score = player.score()
+        record = game.apply(action)
+        try:
+            value = self.solve(game, trades)
+            return player.score() - score - value
+        finally:
+            game.undo(record)
+
+
+class EndgamePlayerStrategy(PlayerStrategy):
+    # Plays solved moves once at most max_deck cards are left in the deck, and the fallback
+    # strategy before that or when the solver gives up. The solver is told how many trades
+    # were played in a row before the move (counted over the game, by seat), so it keeps to
+    # its max_trades.
+    def __init__(self, fallback=None, max_deck=0, solver=None):
+        self.fallback = fallback or RandomPlayerStrategy()
+        self.max_deck = max_deck
+        self.solver = solver or EndgameSolver()
+        self._game = None
+        self._trades = {}
+
+    def choose_action(self, player):
+        game = player._game
+        if self._game is not game:
+            self._game = game
+            self._trades = {}
+
+        # Trades in a row after this seat's last move, and after the opponent's since
+        trades = self._trades.get(player.tag, 0)
+        last = game.opponent(player).last_action
+        trades = trades + 1 if last is not None and last[0] == Action.TRADE else 0
+
+        action = None
+        if game.deck_size <= self.max_deck:
+            try:
+                action = self.solver.best_action(game, min(trades, self.solver.max_trades))[0]
+            except EndgameTooLarge:
+                pass
+        if action is None:
+            action = self.fallback.choose_action(player)
+
+        self._trades[player.tag] = trades + 1 if action[0] == Action.TRADE else 0
+        return action
+
+
+if __name__ == "__main__":
+    # python endgame.py table.npy games: plays random games to their last cards and
+    # solves every position reached with an empty deck, growing the table
+    table = EndgameTable(sys.argv[1])
+    solver = EndgameSolver(table)
+    strategy = RandomPlayerStrategy()
+    solved = gave_up = 0
+    for g in range(int(sys.argv[2])):
+        game = Jaipur(lambda tag, game: Player(strategy, tag, game),
+                      lambda tag, game: Player(strategy, tag, game),
+                      muted=True, seed=g)
+        while game.winner is None:
+            if game.deck_size == 0:
+                try:
+                    solver.value(game)
+                    solved += 1
+                except EndgameTooLarge:
+                    gave_up += 1
+            game = game.switch_player()
+            game.game_winner()
+    table.save()
+    print(solved, 'solved,', gave_up, 'too large,', len(table), 'positions in the table')
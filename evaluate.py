@@ -0,0 +1,110 @@
+import numpy as np
+
+from jaipur import *
+from player import *
+from batch import TOKEN_PREFIX
+from values import *
+
+# Child state features, one int16 row per action: the mover's score, deck size and goods
+# in hand, hand (camels included), market and token stack depths after the action
+F_SCORE = 0
+F_DECK_SIZE = 1
+F_HAND_SIZE = 2
+F_HAND = slice(3, 3 + N_COMMODITIES)
+F_MARKET = slice(F_HAND.stop, F_HAND.stop + N_COMMODITIES)
+F_TOKENS_LEFT = slice(F_MARKET.stop, F_MARKET.stop + N_COMMODITIES)
+N_FEATURES = F_TOKENS_LEFT.stop
+
+
+def child_features(game, ids):
+    # Features of the states the player to move reaches with each of the actions ids, all
+    # computed at once from the action decode tables. Like playing the actions with
+    # Jaipur.apply, takes refill the market from the top of the deck and big sales earn
+    # the bonus token on top of their pile.
+    player = game.player_turn
+    kind, commodity, count, give, take = decode_actions(ids)
+    m = len(ids)
+
+    features = np.empty((m, N_FEATURES), dtype=np.int16)
+    features[:, F_SCORE] = player.score()
+    features[:, F_DECK_SIZE] = game.deck_size
+    features[:, F_HAND_SIZE] = player.hand_size()
+    hands = features[:, F_HAND]
+    markets = features[:, F_MARKET]
+    tokens_left = features[:, F_TOKENS_LEFT]
+    hands[:] = np.frombuffer(player.hand, dtype=np.uint8)
+    markets[:] = np.frombuffer(game.market, dtype=np.uint8)
+    tokens_left[:] = np.frombuffer(game.tokens_left, dtype=np.uint8)
+
+    # Trades (give and take are zero for the other actions); camels given grow the hand
+    hands += take - give
+    markets += give - take
+    features[:, F_HAND_SIZE] += give[:, Commodity.CAMEL]
+
+    rows = np.flatnonzero(kind == Action.TAKE)
+    c = commodity[rows]
+    camels = c == Commodity.CAMEL
+    n = np.where(camels, game.market[Commodity.CAMEL], 1)
+    hands[rows, c] += n
+    markets[rows, c] -= n
+    features[rows, F_HAND_SIZE] += ~camels
+    drawn = np.minimum(n, game.deck_size)
+    features[rows, F_DECK_SIZE] -= drawn
+    for k in range(int(drawn.max(initial=0))):
+        markets[rows[drawn > k], game._deck[game.deck_size - 1 - k]] += 1
+
+    rows = np.flatnonzero(kind == Action.SELL)
+    c = commodity[rows]
+    n = count[rows]
+    hands[rows, c] -= n
+    features[rows, F_HAND_SIZE] -= n
+    left = tokens_left[rows, c]
+    paid = np.minimum(n, left)
+    tokens_left[rows, c] = left - paid
+    bonus = np.array([pile[left - 1] if left else 0 for pile, left in zip(game._bonus, game.bonus_left)])
+    features[rows, F_SCORE] += (TOKEN_PREFIX[c, left] - TOKEN_PREFIX[c, left - paid]
+                                + np.where(n >= 3, bonus[np.clip(n, 3, 5) - 3], 0))
+    return features
+
+
+class LinearEvaluator:
+    # Value of a child state: features @ weights + bias
+    def __init__(self, weights, bias=0.0):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = bias
+
+    def __call__(self, features):
+        return features @ self.weights + self.bias
+
+
+class TableEvaluator:
+    # Value of a child state looked up in a ValueTable or ShardedValueTable by its
+    # state_key, unknown states are worth default
+    def __init__(self, table, default=0.0):
+        self.table = table
+        self.default = default
+
+    def __call__(self, features):
+        keys = pack_states(features[:, F_SCORE], features[:, F_DECK_SIZE], features[:, F_HAND_SIZE],
+                           features[:, F_HAND], features[:, F_MARKET])
+        return self.table.lookup(keys, self.default)
+
+
+class BatchedValuePlayerStrategy(PlayerStrategy):
+    # One-ply greedy agent like ValuePlayerStrategy, scoring every child state with one
+    # evaluator call on the child_features matrix instead of playing each action. With a
+    # TableEvaluator it makes the same choices as ValuePlayerStrategy on the same table,
+    # random draws included.
+
+    def __init__(self, evaluator, epsilon=0.0):
+        self.evaluator = evaluator
+        self.epsilon = epsilon
+
+    def choose_action(self, player):
+        game = player._game
+        ids = legal_ids(player.hand, game.market)
+        if game.rng.random() < self.epsilon:
+            return ACTION_SPACE[game.rng.choice(ids)]
+
+        values = self.evaluator(child_features(game, ids))
+        return ACTION_SPACE[ids[game.rng.choice(np.flatnonzero(values == values.max()))]]
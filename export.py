@@ -0,0 +1,158 @@
+import glob
+import os
+import sys
+
+import numpy as np
+
+from records import *
+
+# Observation of the player to move, one uint8 vector per position:
+# market, own goods, own camels, opponent goods count and camels, token stack depths,
+# deck size, own and opponent score (capped at 255), tokens left in each bonus pile
+OBS_MARKET = slice(0, 7)
+OBS_HAND = slice(7, 13)
+OBS_CAMELS = 13
+OBS_OPPONENT_HAND_SIZE = 14
+OBS_OPPONENT_CAMELS = 15
+OBS_TOKENS_LEFT = slice(16, 22)
+OBS_DECK_SIZE = 22
+OBS_SCORES = slice(23, 25)
+OBS_BONUS_LEFT = slice(25, 28)
+OBS_SIZE = 28
+
+MASK_BYTES = (N_ACTIONS + 7) // 8
+
+# Arrays of a shard, saved as prefix-<shard>.<name>.npy: the observation, the legal actions
+# (np.packbits of legal_mask), the id of the action played, and whether the player to move
+# went on to win (1) or lose (-1) and by how many points
+FIELDS = {
+    'obs': (np.uint8, (OBS_SIZE,)),
+    'mask': (np.uint8, (MASK_BYTES,)),
+    'action': (np.int32, ()),
+    'outcome': (np.int8, ()),
+    'margin': (np.int16, ()),
+}
+
+
+def observe(game):
+    player = game.player_turn
+    opponent = game.opponent()
+    obs = bytearray(game.market)
+    obs += player.hand[1:]
+    obs.append(player.camel_count)
+    obs.append(min(opponent._hand_size, 255))
+    obs.append(opponent.camel_count)
+    obs += game.tokens_left[1:]
+    obs.append(game.deck_size)
+    obs.append(min(player.score(), 255))
+    obs.append(min(opponent.score(), 255))
+    obs += game.bonus_left
+    return obs
+
+
+class PositionExporter(GameRecorder):
+    # Turns games into training positions, written to .npy shards of shard_size positions.
+    # Recorded games go through add_game (or export_records for a whole record file); live
+    # games are exported by attaching the exporter to them like a GameWriter. Rows go
+    # straight into the memmapped shard files, created shard_size rows long; call close()
+    # to trim the last, partial shard. Shards are numbered after the ones already written
+    # with the same prefix, so exporting again adds to them.
+
+    def __init__(self, prefix, shard_size=1 << 16):
+        super().__init__()
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shard = count_shards(prefix)
+        self.positions = 0
+        self._arrays = None
+        self._rows = 0
+
+    def shard_path(self, shard, name):
+        return '%s-%d.%s.npy' % (self.prefix, shard, name)
+
+    def open_shard(self):
+        self._arrays = {name: np.lib.format.open_memmap(self.shard_path(self.shard, name), mode='w+', dtype=dtype,
+                                                        shape=(self.shard_size,) + shape)
+                        for name, (dtype, shape) in FIELDS.items()}
+        self._rows = 0
+
+    def add_game(self, record):
+        final = record.scores
+        winner = record.winner - 1
+        for game, code in zip(replay(record), record.plies):
+            if self._arrays is None:
+                self.open_shard()
+            arrays = self._arrays
+            row = self._rows
+            me = 0 if game.player_turn is game._player1 else 1
+
+            arrays['obs'][row] = np.frombuffer(observe(game), dtype=np.uint8)
+            arrays['mask'][row] = np.packbits(legal_mask(game.player_turn.hand, game.market))
+            arrays['action'][row] = ACTION_IDS[decode_ply(code)]
+            arrays['outcome'][row] = 1 if me == winner else -1
+            arrays['margin'][row] = final[me] - final[1 - me]
+
+            self._rows += 1
+            if self._rows == self.shard_size:
+                self.close_shard()
+
+    def export_records(self, path):
+        for record in read_games(path):
+            self.add_game(record)
+
+    def close_shard(self):
+        arrays, n = self._arrays, self._rows
+        self._arrays = None
+        if arrays is None:
+            return
+
+        for name, out in arrays.items():
+            if n < self.shard_size:
+                # Copies the rows written into a file of the right length (one shard at most)
+                path = self.shard_path(self.shard, name)
+                trimmed = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=out.dtype,
+                                                    shape=(n,) + out.shape[1:])
+                trimmed[:] = out[:n]
+                trimmed.flush()
+                del trimmed
+                del out
+                os.replace(path + '.tmp', path)
+            else:
+                out.flush()
+        arrays.clear()
+
+        if n:
+            self.shard += 1
+            self.positions += n
+        else:
+            for name in FIELDS:
+                os.remove(self.shard_path(self.shard, name))
+
+    def close(self):
+        self.close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def count_shards(prefix):
+    return len(glob.glob(glob.escape(prefix) + '-*.action.npy'))
+
+
+def load_shard(prefix, shard):
+    # The arrays of a shard as read-only memmaps, nothing is read until it is indexed
+    return {name: np.load('%s-%d.%s.npy' % (prefix, shard, name), mmap_mode='r') for name in FIELDS}
+
+
+def load_shards(prefix):
+    return [load_shard(prefix, i) for i in range(count_shards(prefix))]
+
+
+if __name__ == "__main__":
+    # python export.py file.jpr prefix: exports every position of a record file
+    with PositionExporter(sys.argv[2]) as exporter:
+        exporter.export_records(sys.argv[1])
+    print(exporter.positions, 'positions in', exporter.shard, 'shards')
@@ -0,0 +1,151 @@
+import json
+import os
+import random
+import sys
+
+import numpy as np
+
+from records import *
+
+# Per game: byte offset of its record, number of plies and its first keyframe
+GAME = np.dtype([('offset', '<u8'), ('plies', '<u2'), ('keyframe', '<u4')])
+
+# Full game state before a ply, everything but the order of the deck and bonus piles
+# (which is in the record)
+KEYFRAME = np.dtype([('market', 'u1', N_COMMODITIES), ('hands', 'u1', (2, N_COMMODITIES)),
+                     ('tokens_left', 'u1', N_COMMODITIES), ('bonus_left', 'u1', len(BONUS_TOKENS)),
+                     ('deck_size', 'u1'), ('empty_stacks', 'u1'),
+                     ('turn', 'u1'), ('scores', '<i2', 2), ('n_tokens', 'u1', 2)])
+
+
+def keyframe(game):
+    frame = np.zeros((), dtype=KEYFRAME)
+    frame['market'] = np.frombuffer(game.market, dtype=np.uint8)
+    frame['hands'][0] = np.frombuffer(game._player1.hand, dtype=np.uint8)
+    frame['hands'][1] = np.frombuffer(game._player2.hand, dtype=np.uint8)
+    frame['tokens_left'] = np.frombuffer(game.tokens_left, dtype=np.uint8)
+    frame['bonus_left'] = np.frombuffer(game.bonus_left, dtype=np.uint8)
+    frame['deck_size'] = game.deck_size
+    frame['empty_stacks'] = game.empty_stacks
+    frame['turn'] = game.player_turn is game._player2
+    frame['scores'] = game._player1.score(), game._player2.score()
+    frame['n_tokens'] = len(game._player1.tokens), len(game._player2.tokens)
+    return frame
+
+
+def restore(game, frame):
+    # Sets game to a keyframe. Token lists are not kept: a player's score comes back as a
+    # single token, followed by zeros so that it holds as many tokens as it did.
+    game.market[:] = frame['market'].tobytes()
+    game.market_size = int(frame['market'].sum())
+    game.tokens_left[:] = frame['tokens_left'].tobytes()
+    game.bonus_left[:] = frame['bonus_left'].tobytes()
+    game.deck_size = int(frame['deck_size'])
+    game.empty_stacks = int(frame['empty_stacks'])
+
+    for i, player in enumerate((game._player1, game._player2)):
+        player.hand[:] = frame['hands'][i].tobytes()
+        player._hand_size = int(frame['hands'][i][1:].sum())
+        n = int(frame['n_tokens'][i])
+        player.tokens = [int(frame['scores'][i])] + [0] * (n - 1) if n else []
+
+    game.player_turn = game._player2 if frame['turn'] else game._player1
+    game.winner = None
+    game.zobrist = game.compute_zobrist()
+    game.game_winner()
+
+
+class GameIndex:
+    # Seek index of a record file, kept next to it as path.games.npy, path.keyframes.npy and
+    # path.index.json. Every `interval` plies of every game (ply 0 included) has a keyframe,
+    # so position(g, k) restores the keyframe at or before ply k and plays at most
+    # interval - 1 recorded plies from there.
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + '.index.json') as f:
+            meta = json.load(f)
+        self.interval = meta['interval']
+        self.games = np.load(path + '.games.npy', mmap_mode='r')
+        self.keyframes = np.load(path + '.keyframes.npy', mmap_mode='r')
+        self.file = open(path, 'rb')
+
+    @classmethod
+    def build(cls, path, interval=8):
+        # Indexes the games of path, or only the ones appended since the last build
+        games = np.zeros(0, dtype=GAME)
+        keyframes = np.zeros(0, dtype=KEYFRAME)
+        offset = None
+        if os.path.exists(path + '.index.json'):
+            with open(path + '.index.json') as f:
+                meta = json.load(f)
+            if meta['interval'] == interval:
+                games = np.load(path + '.games.npy')
+                keyframes = np.load(path + '.keyframes.npy')
+                offset = meta['size']
+
+        new_games = []
+        new_keyframes = []
+        first = len(keyframes)
+        size = offset or len(MAGIC)
+        for record in read_games(path, offset):
+            new_games.append((size, len(record.plies), first + len(new_keyframes)))
+            for k, game in enumerate(replay(record)):
+                if k % interval == 0:
+                    new_keyframes.append(keyframe(game))
+            size += RECORD.size + 4 * len(record.plies)
+
+        games = np.concatenate([games, np.array(new_games, dtype=GAME)])
+        if new_keyframes:
+            keyframes = np.concatenate([keyframes, np.stack(new_keyframes)])
+        np.save(path + '.games.npy', games)
+        np.save(path + '.keyframes.npy', keyframes)
+        with open(path + '.index.json', 'w') as f:
+            json.dump({'interval': interval, 'size': size, 'games': len(games)}, f)
+        return cls(path)
+
+    def __len__(self):
+        return len(self.games)
+
+    def plies(self, g):
+        return int(self.games['plies'][g])
+
+    def record_header(self, g):
+        self.file.seek(int(self.games['offset'][g]))
+        return RECORD.unpack(self.file.read(RECORD.size))
+
+    def codes(self, g, start, stop):
+        # Ply codes start..stop-1 of game g, read straight from the file
+        self.file.seek(int(self.games['offset'][g]) + RECORD.size + 4 * start)
+        codes = array('I')
+        codes.frombytes(self.file.read(4 * (stop - start)))
+        if sys.byteorder != 'little':
+            codes.byteswap()
+        return codes
+
+    def position(self, g, k):
+        # The game of record g before its ply k (k == plies is the final position)
+        game_entry = self.games[g]
+        if not 0 <= k <= game_entry['plies']:
+            raise IndexError('game %d has %d plies' % (g, game_entry['plies']))
+
+        header = self.record_header(g)
+        game = Jaipur(replay_player, replay_player, muted=True, deck=header[4], bonus=split_bonus(header[5]))
+        start = k - k % self.interval
+        restore(game, self.keyframes[int(game_entry['keyframe']) + start // self.interval])
+        for code in self.codes(g, start, k):
+            game.apply(decode_ply(code))
+        return game
+
+    def random_position(self, rng=random):
+        g = rng.randrange(len(self.games))
+        return self.position(g, rng.randint(0, self.plies(g)))
+
+    def close(self):
+        self.file.close()
+
+
+if __name__ == "__main__":
+    # python index.py file.jpr [interval]: builds or extends the index of a record file
+    index = GameIndex.build(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 8)
+    print(len(index), 'games,', len(index.keyframes), 'keyframes')
@@ -0,0 +1,248 @@
+import json
+import time
+
+from jaipur import *
+from player import *
+
+# Latency histograms have one bucket per power of two nanoseconds
+BUCKETS = 64
+
+
+class Instruments:
+    # Call counts, latency histograms and branching factors of the engine hot paths.
+    #
+    # Nothing is measured until install() has patched timing wrappers into Jaipur, Player
+    # and the PlayerStrategy subclasses, and uninstall() puts the plain methods back, so
+    # there is no cost at all while instrumentation is off. Once installed, a game is
+    # measured by the Instruments attached to it (attach(game), per game) or else by the
+    # ones passed to enable() (per process).
+
+    def __init__(self):
+        self.calls = {}
+        self.branching = {}     # legal actions -> decisions
+        self.per_ply = []       # [decisions, legal actions, max] by ply
+        self._plies = {}
+        self._deciding = None   # (game, zobrist) of the turn being played, see switch_player
+
+    def attach(self, game):
+        install()
+        game.instruments = self
+        return game
+
+    def record(self, name, ns):
+        stats = self.calls.get(name)
+        if stats is None:
+            stats = self.calls[name] = [0, 0, [0] * BUCKETS]
+        stats[0] += 1
+        stats[1] += ns
+        stats[2][ns.bit_length()] += 1
+
+    def record_branching(self, game, n):
+        ply = self._plies.get(game, 0)
+        self._plies[game] = ply + 1
+        self.branching[n] = self.branching.get(n, 0) + 1
+
+        while len(self.per_ply) <= ply:
+            self.per_ply.append([0, 0, 0])
+        stats = self.per_ply[ply]
+        stats[0] += 1
+        stats[1] += n
+        stats[2] = max(stats[2], n)
+
+    def end_game(self, game):
+        self._plies.pop(game, None)
+
+    def snapshot(self):
+        calls = {}
+        for name, (count, total, histogram) in sorted(self.calls.items()):
+            calls[name] = {
+                'count': count,
+                'total_ns': total,
+                'mean_ns': total / count,
+                'p50_ns': percentile(histogram, count, 0.5),
+                'p90_ns': percentile(histogram, count, 0.9),
+                'p99_ns': percentile(histogram, count, 0.99),
+                'histogram': {str(1 << i): n for i, n in enumerate(histogram) if n},
+            }
+
+        decisions = sum(self.branching.values())
+        return {
+            'calls': calls,
+            'branching': {
+                'decisions': decisions,
+                'mean': sum(n * k for n, k in self.branching.items()) / decisions if decisions else 0.0,
+                'max': max(self.branching, default=0),
+                'histogram': {str(n): k for n, k in sorted(self.branching.items())},
+                'per_ply': [{'decisions': k, 'mean': total / k, 'max': most}
+                            for k, total, most in self.per_ply if k],
+            },
+        }
+
+    def merge(self, other):
+        # Adds the counts of other Instruments, e.g. sent back by worker processes
+        for name, (count, total, histogram) in other.calls.items():
+            stats = self.calls.setdefault(name, [0, 0, [0] * BUCKETS])
+            stats[0] += count
+            stats[1] += total
+            stats[2] = [a + b for a, b in zip(stats[2], histogram)]
+        for n, k in other.branching.items():
+            self.branching[n] = self.branching.get(n, 0) + k
+        for ply, (k, total, most) in enumerate(other.per_ply):
+            while len(self.per_ply) <= ply:
+                self.per_ply.append([0, 0, 0])
+            stats = self.per_ply[ply]
+            stats[0] += k
+            stats[1] += total
+            stats[2] = max(stats[2], most)
+
+    def __getstate__(self):
+        return {'calls': self.calls, 'branching': self.branching, 'per_ply': self.per_ply, '_plies': {}, '_deciding': None}
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+def percentile(histogram, count, q):
+    # Upper bound of the bucket holding the q-th fraction of the calls
+    rank = q * count
+    seen = 0
+    for i, n in enumerate(histogram):
+        seen += n
+        if seen >= rank:
+            return 1 << i
+    return 0
+
+
+# Instruments used for games without their own, set by enable()
+_process = None
+_originals = {}
+
+
+def enable(instruments=None):
+    # Measures every game of this process, returns the Instruments used
+    global _process
+    _process = instruments or Instruments()
+    install()
+    return _process
+
+
+def disable():
+    global _process
+    _process = None
+    uninstall()
+
+
+def timed(name, method, kind):
+    # Timing wrapper of a method of Jaipur (kind 'game'), Player ('player') or a strategy
+    # ('strategy'). Untimed calls cost two attribute lookups and a test.
+    perf_counter_ns = time.perf_counter_ns
+
+    def finish(instruments, start, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        finally:
+            instruments.record(name, perf_counter_ns() - start)
+
+    if kind == 'game':
+        def wrapper(self, *args, **kwargs):
+            instruments = self.instruments or _process
+            if instruments is None:
+                return method(self, *args, **kwargs)
+            return finish(instruments, perf_counter_ns(), self, *args, **kwargs)
+    elif kind == 'player':
+        def wrapper(self, *args, **kwargs):
+            instruments = self._game.instruments or _process
+            if instruments is None:
+                return method(self, *args, **kwargs)
+            return finish(instruments, perf_counter_ns(), self, *args, **kwargs)
+    else:
+        def wrapper(self, player, *args, **kwargs):
+            instruments = player._game.instruments or _process
+            if instruments is None:
+                return method(self, player, *args, **kwargs)
+            return finish(instruments, perf_counter_ns(), self, player, *args, **kwargs)
+
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+def get_all_actions(self):
+    # Timed, and the first listing of the actions at the position of the turn being played
+    # (a copy of it included, searches list them on copies) gives its branching factor
+    instruments = self._game.instruments or _process
+    if instruments is None:
+        return _originals[Player, 'get_all_actions'](self)
+
+    start = time.perf_counter_ns()
+    actions = _originals[Player, 'get_all_actions'](self)
+    instruments.record('get_all_actions', time.perf_counter_ns() - start)
+
+    deciding = instruments._deciding
+    if deciding is not None and deciding[1] == self._game.zobrist:
+        instruments._deciding = None
+        instruments.record_branching(deciding[0], len(actions))
+    return actions
+
+
+def switch_player(self):
+    # Times the turn, counts the legal actions of the player to move (see get_all_actions)
+    # and ends the ply count when the move ends the game
+    instruments = self.instruments or _process
+    if instruments is None:
+        return _originals[Jaipur, 'switch_player'](self)
+
+    player = self.player_turn
+    hand, market = bytes(player.hand), bytes(self.market)
+    instruments._deciding = self, self.zobrist
+    start = time.perf_counter_ns()
+    game = _originals[Jaipur, 'switch_player'](self)
+    instruments.record('switch_player', time.perf_counter_ns() - start)
+
+    if instruments._deciding is not None:
+        # The strategy never listed them: count them apart from the cache, whose
+        # statistics and contents stay the strategy's own
+        instruments._deciding = None
+        instruments.record_branching(self, len(generate_actions(hand, market)))
+
+    if game.empty_stacks >= 3 or game.market_size < 5:
+        instruments.end_game(game)
+    return game
+
+
+def strategy_classes(cls=PlayerStrategy):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from strategy_classes(subclass)
+
+
+def install():
+    # Patches the timing wrappers in. Strategy classes defined after this are not timed.
+    if _originals:
+        return
+
+    patches = [
+        (Jaipur, 'pick_commodity', 'game'),
+        (Jaipur, 'game_winner', 'game'),
+        (Player, 'do_action', 'player'),
+    ]
+    for cls in strategy_classes():
+        if 'choose_action' in cls.__dict__:
+            patches.append((cls, 'choose_action', 'strategy'))
+
+    for cls, name, kind in patches:
+        method = cls.__dict__[name]
+        _originals[cls, name] = method
+        label = name if kind != 'strategy' else '%s.%s' % (name, cls.__name__)
+        setattr(cls, name, timed(label, method, kind))
+
+    _originals[Player, 'get_all_actions'] = Player.__dict__['get_all_actions']
+    Player.get_all_actions = get_all_actions
+    _originals[Jaipur, 'switch_player'] = Jaipur.__dict__['switch_player']
+    Jaipur.switch_player = switch_player
+
+
+def uninstall():
+    for (cls, name), method in _originals.items():
+        setattr(cls, name, method)
+    _originals.clear()
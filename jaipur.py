@@ -1,7 +1,6 @@
 import random
 from enum import Enum, IntEnum, unique
 from itertools import cycle, combinations, product
-from collections import Counter
 import numpy as np
 import copy
 import pickle
@@ -29,88 +28,257 @@ class Commodity(IntEnum):
         return commodity in [self.DIAMOND, self.GOLD, self.SILVER]
 
 
-class Jaipur:
+# Commodities index the fixed-size count vectors used for market, hands and token stacks
+COMMODITIES = tuple(Commodity)
+GOODS = COMMODITIES[1:]
+N_COMMODITIES = len(COMMODITIES)
+PRECIOUS = tuple(Commodity.is_precious(i) for i in COMMODITIES)
+
+# Token stacks are stored bottom first, the top of stack c is PRICE_TOKENS[c][tokens_left[c] - 1]
+PRICE_TOKENS = (
+    (),                             # CAMEL
+    (1, 1, 1, 1, 1, 1, 2, 3, 4),    # LEATHER
+    (1, 1, 2, 2, 3, 3, 5),          # SPICE
+    (1, 1, 2, 2, 3, 3, 5),          # SILK
+    (5, 5, 5, 5, 5),                # SILVER
+    (5, 5, 5, 6, 6),                # GOLD
+    (5, 5, 5, 7, 7),                # DIAMOND
+)
+
+DECK = bytes([Commodity.DIAMOND] * 6 + [Commodity.GOLD] * 6 + [Commodity.SILVER] * 6 +
+             [Commodity.SILK] * 8 + [Commodity.SPICE] * 8 + [Commodity.LEATHER] * 10 +
+             [Commodity.CAMEL] * 8) #8 camels + 3 camels in market (11 total)
+
+# Bonus tokens for selling 3, 4 and 5 or more cards, each pile shuffled face down
+BONUS_TOKENS = (
+    (1, 1, 2, 2, 2, 3, 3),
+    (4, 4, 5, 5, 6, 6),
+    (8, 8, 9, 10, 10),
+)
+
+MAX_HAND_SIZE = 7
+
+
+def bonus_pile(count):
+    # Bonus pile paid out for selling count (3 or more) cards
+    return min(count, 5) - 3
+
+
+# Zobrist keys: MARKET_KEYS[c][n] stands for n cards of c in the market, HAND_KEYS[p][c][n]
+# for n cards of c in player p's hand, TOKEN_KEYS[c][n] for a token stack n tokens deep and
+# DECK_KEYS[n] for n cards left in the deck, BONUS_KEYS[k][n] for n tokens left in bonus pile k.
+# SIDE_KEY is xored in while P2 is to move.
+_zobrist_random = random.Random(0x4a414950)
+CARD_TOTALS = tuple(DECK.count(i) + (3 if i == Commodity.CAMEL else 0) for i in COMMODITIES)
+MARKET_KEYS = tuple(tuple(_zobrist_random.getrandbits(64) for n in range(CARD_TOTALS[i] + 1)) for i in COMMODITIES)
+HAND_KEYS = tuple(tuple(tuple(_zobrist_random.getrandbits(64) for n in range(CARD_TOTALS[i] + 1)) for i in COMMODITIES)
+                  for p in range(2))
+TOKEN_KEYS = tuple(tuple(_zobrist_random.getrandbits(64) for n in range(len(PRICE_TOKENS[i]) + 1)) for i in COMMODITIES)
+DECK_KEYS = tuple(_zobrist_random.getrandbits(64) for n in range(len(DECK) + 1))
+SIDE_KEY = _zobrist_random.getrandbits(64)
+BONUS_KEYS = tuple(tuple(_zobrist_random.getrandbits(64) for n in range(len(i) + 1)) for i in BONUS_TOKENS)
+
+
+def game_seed(root, index):
+    # Seed of game `index` of a run seeded with `root`. Seeds of different games come from
+    # independent SeedSequence streams, so do not depend on which worker plays which game.
+    return int(np.random.SeedSequence(root, spawn_key=(index,)).generate_state(2, np.uint64)
+               .view(np.uint64)[0])
+
+
+class GameListener:
+    # Event hooks of a game, called by Jaipur.switch_player on every real move (never by
+    # Jaipur.apply, so searches do not trigger them)
+
+    def move_applied(self, game, player, action):
+        pass
+
+    def turn_switched(self, game, player):
+        pass
+
+    def game_ended(self, game):
+        pass
+
+
+class ConsoleListener(GameListener):
+    # The move messages of an unmuted game
+
+    def move_applied(self, game, player, action):
+        if game.muted:
+            return
+        if action[0] == Action.TAKE:
+            print('taking..', COMMODITIES[action[1]])
+        elif action[0] == Action.SELL:
+            print('selling..', COMMODITIES[action[1]])
+        else:
+            print('trading..', action[1])
+
 
-    def __init__(self, player1_type, player2_type, muted=False):
+class Jaipur:
+    # A muted game is headless: it does no I/O and formats no strings, anything that needs
+    # to follow it goes through its listeners (GameListener).
+    #
+    # The whole game state is a handful of byte vectors and counters:
+    # market[c] and hand[c] are card counts (hand[CAMEL] is the herd), tokens_left[c] is the
+    # depth of each token stack, _deck[:deck_size] are the cards still to be drawn and
+    # _bonus[k][:bonus_left[k]] the tokens left in bonus pile k, drawn from the end as well.
+    __slots__ = ('muted', 'market', 'market_size', 'tokens_left', 'empty_stacks', '_deck', 'deck_size',
+                 '_bonus', 'bonus_left',
+                 '_player1', '_player2', 'winner', 'player_turn', 'zobrist', 'listeners', 'instruments', 'seed', 'rng')
+
+    def __init__(self, player1_type, player2_type, muted=False, deck=None, listeners=(), instruments=None,
+                 seed=None, bonus=None):
+        # deck and bonus: the shuffled deck to deal from and the three shuffled bonus piles
+        # (replays), listeners: GameListeners such as a
+        # records.GameRecorder, instruments: an instrument.Instruments (see instrument.install),
+        # seed: seed of the game's own random generator rng (see game_seed), which deals the
+        # deck and draws everything random in the game. None seeds it from the OS.
+        self.seed = seed
+        self.rng = random.Random(seed)
         self.muted = muted
+        self.zobrist = 0
+        self.listeners = tuple(listeners) if muted else (ConsoleListener(),) + tuple(listeners)
+        self.instruments = instruments
 
-        self.price_tokens = {
-            Commodity.DIAMOND:  [5, 5, 5, 7, 7],
-            Commodity.GOLD:     [5, 5, 5, 6, 6], 
-            Commodity.SILVER:   [5, 5, 5, 5, 5], 
-            Commodity.SILK:     [1, 1, 2, 2, 3, 3, 5], 
-            Commodity.SPICE:    [1, 1, 2, 2, 3, 3, 5], 
-            Commodity.LEATHER:  [1, 1, 1, 1, 1, 1, 2, 3, 4], 
-        }
+        self.tokens_left = bytearray(len(i) for i in PRICE_TOKENS)
+        self.empty_stacks = 0
 
-        self._deck = [Commodity.DIAMOND] * 6 + [Commodity.GOLD] * 6 + [Commodity.SILVER] * 6 + \
-                       [Commodity.SILK] * 8 + [Commodity.SPICE] * 8 + [Commodity.LEATHER] * 10 + \
-                       [Commodity.CAMEL] * 8 #8 camels + 3 camels in market (11 total)
-        random.shuffle(self._deck)
+        if deck is None:
+            self._deck = bytearray(DECK)
+            self.rng.shuffle(self._deck)
+        else:
+            self._deck = bytearray(deck)
+        self.deck_size = len(self._deck)
 
-        self.market = Counter()
-        for i in Commodity:
-            self.market[i] = 0
+        if bonus is None:
+            self._bonus = tuple(bytearray(i) for i in BONUS_TOKENS)
+            for i in self._bonus:
+                self.rng.shuffle(i)
+        else:
+            self._bonus = tuple(bytearray(i) for i in bonus)
+        self.bonus_left = bytearray(len(i) for i in self._bonus)
 
+        self.market = bytearray(N_COMMODITIES)
         self.market[Commodity.CAMEL] = 3
-
-        for i in range(2):
-            self.market[self._deck.pop()] += 1
+        self.market_size = 3
+        self.refill(2)
 
         self._player1 = player1_type(tag='P1', game=self)
         self._player2 = player2_type(tag='P2', game=self)
+        self._player1.hand_keys = HAND_KEYS[0]
+        self._player2.hand_keys = HAND_KEYS[1]
 
         # Deal 5 cards to each player
         for i in range(5):
             for _player in self._player1, self._player2:
-                commodity = self._deck.pop()
-                if commodity == Commodity.CAMEL:
-                    _player.camel_count += 1
-                else:
-                    _player.hand[commodity] += 1
+                commodity = self.draw()
+                _player.hand[commodity] += 1
+                if commodity != Commodity.CAMEL:
+                    _player._hand_size += 1
 
         self.winner = None
-        self._players_gen = cycle([self._player1, self._player2]) 
-        self.player_turn = next(self._players_gen)
+        self.player_turn = self._player1
+        self.zobrist = self.compute_zobrist()
+
+    @property
+    def price_tokens(self):
+        return {i: list(PRICE_TOKENS[i][:self.tokens_left[i]]) for i in reversed(GOODS)}
+
+    def compute_zobrist(self):
+        # Full hash of the state, the moves keep self.zobrist up to date incrementally
+        h = DECK_KEYS[self.deck_size]
+        for k, left in enumerate(self.bonus_left):
+            h ^= BONUS_KEYS[k][left]
+        for i in COMMODITIES:
+            h ^= MARKET_KEYS[i][self.market[i]] ^ TOKEN_KEYS[i][self.tokens_left[i]]
+            h ^= HAND_KEYS[0][i][self._player1.hand[i]] ^ HAND_KEYS[1][i][self._player2.hand[i]]
+        if self.player_turn is self._player2:
+            h ^= SIDE_KEY
+        return h
+
+    def draw(self):
+        self.zobrist ^= DECK_KEYS[self.deck_size] ^ DECK_KEYS[self.deck_size - 1]
+        self.deck_size -= 1
+        return self._deck[self.deck_size]
+
+    def refill(self, count):
+        count = min(count, self.deck_size)
+        for i in range(count):
+            self.add_market(self.draw(), 1)
+        self.market_size += count
+
+    def add_market(self, commodity, count):
+        n = self.market[commodity]
+        self.market[commodity] = n + count
+        self.zobrist ^= MARKET_KEYS[commodity][n] ^ MARKET_KEYS[commodity][n + count]
+
+    def pop_token(self, commodity):
+        left = self.tokens_left[commodity]
+        if not left:
+            return None
+
+        left -= 1
+        self.tokens_left[commodity] = left
+        self.zobrist ^= TOKEN_KEYS[commodity][left + 1] ^ TOKEN_KEYS[commodity][left]
+        if not left:
+            self.empty_stacks += 1
+        return PRICE_TOKENS[commodity][left]
+
+    def pop_bonus(self, count):
+        # Bonus token for selling count cards, None once its pile is used up
+        k = bonus_pile(count)
+        left = self.bonus_left[k]
+        if not left:
+            return None
+
+        left -= 1
+        self.bonus_left[k] = left
+        self.zobrist ^= BONUS_KEYS[k][left + 1] ^ BONUS_KEYS[k][left]
+        return self._bonus[k][left]
+
+    def bonus_remaining(self, count):
+        # The tokens still in the bonus pile for selling count cards, in no particular order
+        # as far as the players know
+        k = bonus_pile(count)
+        return sorted(self._bonus[k][:self.bonus_left[k]])
+
+    def bonus_expectation(self, count):
+        # Expected bonus for selling count cards
+        if count < 3:
+            return 0.0
+        k = bonus_pile(count)
+        left = self.bonus_left[k]
+        return sum(self._bonus[k][:left]) / left if left else 0.0
 
     def pick_commodity(self, commodity=None):
-        if sum(self.market.values()) == 0: #Assert
+        market = self.market
+        if self.market_size == 0: #Assert
             return (None, 0)
 
-        if commodity is not None and self.market[commodity] > 0: #Assert
-            picked_commodity = commodity
-        else:
-            market_list = []
-            for c in self.market:
-                if self.market[c] > 0:
-                    market_list += [c] * self.market[c]
-
-            picked_commodity = random.choice(market_list)
-                
-        pick_count = 0
+        if commodity is None or market[commodity] == 0: #Assert
+            # Every card in the market is equally likely
+            r = self.rng.randrange(self.market_size)
+            for commodity in COMMODITIES:
+                r -= market[commodity]
+                if r < 0:
+                    break
 
         # When player takes camel, all camels in market must be taken
-        if picked_commodity == Commodity.CAMEL:
-            market_camels = self.market[Commodity.CAMEL]
-            pick_count = market_camels 
-            self.market[Commodity.CAMEL] = 0
-
-            for i in range(market_camels):
-                if self._deck:
-                    self.market[self._deck.pop()] += 1
-
+        if commodity == Commodity.CAMEL:
+            pick_count = market[commodity]
         else:
             pick_count = 1
-            self.market[picked_commodity] -= 1
-            if self._deck:
-                self.market[self._deck.pop()] += 1
 
-        return (picked_commodity, pick_count)
+        self.add_market(commodity, -pick_count)
+        self.market_size -= pick_count
+        self.refill(pick_count)
+
+        return (COMMODITIES[commodity], pick_count)
 
     # print hand or market with less clutter
-    def pprint(self, s, c):
+    def pprint(self, s, c, commodities=COMMODITIES):
         print(s, end=' ')
-        for i in c.keys():
+        for i in commodities:
             if c[i] > 0:
                 print('%s: %d,'%(i, c[i]), end=' ')
         print()
@@ -120,10 +288,10 @@ class Jaipur:
             return
 
         print('price_tokens: ', self.price_tokens.values())
-        print('deck size:', len(self._deck))
+        print('deck size:', self.deck_size)
         self.pprint('market: ', self.market)
-        self.pprint('P1 hand: ', self._player1.hand)
-        self.pprint('P2 hand: ', self._player2.hand)
+        self.pprint('P1 hand: ', self._player1.hand, GOODS)
+        self.pprint('P2 hand: ', self._player2.hand, GOODS)
         print('P1 camels:', self._player1.camel_count)
         print('P2 camels:', self._player2.camel_count)
         print('P1 tokens: ', self._player1.tokens)
@@ -134,9 +302,9 @@ class Jaipur:
         print()
 
     def play_game(self):
-
-        print('----------------- GAME STARTED -------------------')
-        self.print_game()
+        if not self.muted:
+            print('----------------- GAME STARTED -------------------')
+            self.print_game()
 
         while self.winner is None:
             if not self.muted:
@@ -147,28 +315,104 @@ class Jaipur:
 
             self.game_winner()
 
-        else:
+        if not self.muted:
             print('----------------- GAME ENDED -------------------')
             self.print_game()
             # final score includes bonus tokens as well
             print('P1 final score:', self._player1.final_score)
             print('P2 final score:', self._player2.final_score)
             print()
-        
+
         return self.winner
 
 
     def switch_player(self):
-        self = self.player_turn.do_action(self.winner)
-
-        self.player_turn = next(self._players_gen)
+        player = self.player_turn
+        self = player.do_action(self.winner)
+
+        self.player_turn = self.opponent()
+        self.zobrist ^= SIDE_KEY
+
+        if self.listeners:
+            for listener in self.listeners:
+                listener.move_applied(self, player, player.last_action)
+            ended = self.game_winner() is not None
+            for listener in self.listeners:
+                listener.turn_switched(self, self.player_turn)
+            if ended:
+                for listener in self.listeners:
+                    listener.game_ended(self)
         return self
 
+    def opponent(self, player=None):
+        if player is None:
+            player = self.player_turn
+        return self._player2 if player is self._player1 else self._player1
+
+    def apply(self, action):
+        # Plays action for the player to move like switch_player + game_winner do,
+        # and returns the record undo needs to reverse it
+        player = self.player_turn
+        sale = action[0] == Action.SELL
+        record = (player, action, self.zobrist, self.deck_size, self.market[Commodity.CAMEL],
+                  len(player.tokens), self.tokens_left[action[1]] if sale else 0,
+                  self.bonus_left[bonus_pile(action[2])] if sale and action[2] >= 3 else 0,
+                  self.empty_stacks, self.winner, self._player1.final_score, self._player2.final_score)
+
+        player.play(action)
+        self.player_turn = self.opponent()
+        self.zobrist ^= SIDE_KEY
+        self.game_winner()
+        return record
+
+    def undo(self, record):
+        (player, action, self.zobrist, deck_size, market_camels, n_tokens, tokens_left, bonus_left,
+         empty_stacks, self.winner, self._player1.final_score, self._player2.final_score) = record
+
+        self.player_turn = player
+        hand = player.hand
+        market = self.market
+
+        if action[0] == Action.TAKE:
+            # Cards drawn to refill the market are still in _deck above deck_size
+            for i in range(self.deck_size, deck_size):
+                market[self._deck[i]] -= 1
+            self.market_size -= deck_size - self.deck_size
+            self.deck_size = deck_size
+
+            commodity = action[1]
+            count = market_camels if commodity == Commodity.CAMEL else 1
+            market[commodity] += count
+            self.market_size += count
+            hand[commodity] -= count
+            if commodity != Commodity.CAMEL:
+                player._hand_size -= count
+
+        elif action[0] == Action.SELL:
+            commodity, count = action[1], action[2]
+            hand[commodity] += count
+            player._hand_size += count
+            self.tokens_left[commodity] = tokens_left
+            if count >= 3:
+                self.bonus_left[bonus_pile(count)] = bonus_left
+            self.empty_stacks = empty_stacks
+            del player.tokens[n_tokens:]
+
+        elif action[0] == Action.TRADE:
+            give, take = action[1]
+            for i in take:
+                hand[i] -= 1
+                market[i] += 1
+            for i in give:
+                market[i] -= 1
+                hand[i] += 1
+            player._hand_size -= give.count(Commodity.CAMEL)
+
 
     def game_winner(self):
         # End game if 3 resources are sold completely
         # Or if market goes less than 5
-        if len(['empty' for i in self.price_tokens.values() if not i]) >= 3 or (sum(self.market.values()) < 5):
+        if self.empty_stacks >= 3 or self.market_size < 5:
             self._player1.final_score = self._player1.score()
             self._player2.final_score = self._player2.score()
 
@@ -184,6 +428,3 @@ class Jaipur:
             else:
                 self.winner = self._player2.tag #TODO tie breaker
         return self.winner
-
-
-
@@ -0,0 +1,191 @@
+import functools
+import json
+import math
+import os
+import queue
+import sys
+from multiprocessing import Pool
+
+from jaipur import *
+from player import *
+from search import ExpectimaxPlayerStrategy
+from mcts import MCTSPlayerStrategy
+from tournament import play_chunk
+
+# Glicko: a new strategy starts at RATING with deviation MAX_RD, deviations never drop
+# below MIN_RD so ratings keep following strategies that change without a new version
+Q = math.log(10) / 400
+RATING = 1500.0
+MAX_RD = 350.0
+MIN_RD = 30.0
+
+
+def g(rd):
+    return 1 / math.sqrt(1 + 3 * Q * Q * rd * rd / (math.pi * math.pi))
+
+
+def expected_score(rating, other, other_rd):
+    return 1 / (1 + 10 ** (-g(other_rd) * (rating - other) / 400))
+
+
+def glicko_update(rating, rd, other, other_rd, games, wins):
+    # New (rating, rd) after `games` games against one opponent, taken as one rating period
+    e = expected_score(rating, other, other_rd)
+    gg = g(other_rd)
+    d2 = 1 / (Q * Q * gg * gg * e * (1 - e) * games)
+    precision = 1 / (rd * rd) + 1 / d2
+    rating += Q / precision * gg * (wins - games * e)
+    return rating, max(math.sqrt(1 / precision), MIN_RD)
+
+
+class League:
+    # Glicko ratings of a pool of strategies, kept up to date by matches between the most
+    # informative pairings instead of full round robins.
+    #
+    # Strategies are registered by name with a picklable factory (see Tournament) and an
+    # optional version; ratings, per pairing results and the game counter live in a JSON
+    # file, so a league is resumed by registering the same names again. Registering a new
+    # version of a strategy keeps its rating as a prior but resets its deviation, so the
+    # scheduler plays it until it is placed again.
+    #
+    # run() keeps `processes` matches of `match_size` games in flight on a process pool,
+    # updates the ratings as each one finishes and saves the league, then picks the next
+    # pairing from the updated ratings.
+
+    def __init__(self, path, seed=0, processes=None, match_size=20):
+        self.path = path
+        self.seed = seed
+        self.processes = processes
+        self.match_size = match_size
+        self.factories = {}
+        self.ratings = {}
+        self.results = {}       # 'a|b' with a < b -> [games, wins of a]
+        self.games = 0
+
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.ratings = state['ratings']
+            self.results = state['results']
+            self.games = state['games']
+
+    def register(self, name, factory, version=None):
+        self.factories[name] = factory
+        entry = self.ratings.get(name)
+        if entry is None:
+            self.ratings[name] = {'rating': RATING, 'rd': MAX_RD, 'games': 0, 'wins': 0, 'version': version}
+        elif entry['version'] != version:
+            entry['rd'] = MAX_RD
+            entry['version'] = version
+
+    def save(self):
+        state = {'ratings': self.ratings, 'results': self.results, 'games': self.games}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(self.path + '.tmp', self.path)
+
+    def information(self, a, b):
+        # How much a match between a and b is expected to tell: the drop of the two rating
+        # variances it would bring (whatever the result, see glicko_update)
+        ra, rb = self.ratings[a], self.ratings[b]
+        drop = 0.0
+        for me, other in (ra, rb), (rb, ra):
+            e = expected_score(me['rating'], other['rating'], other['rd'])
+            games = self.match_size * Q * Q * g(other['rd']) ** 2 * e * (1 - e)
+            rd = max(math.sqrt(1 / (1 / me['rd'] ** 2 + games)), MIN_RD)
+            drop += me['rd'] ** 2 - rd * rd
+        return drop
+
+    def next_pairing(self, in_flight=()):
+        # Most informative pairing of registered strategies, each match already in flight
+        # between the same two halving its worth. Once every rating is settled, the
+        # pairing with the fewest games so far.
+        names = sorted(self.factories)
+        best = None
+        for i, a in enumerate(names):
+            for b in names[i + 1:]:
+                worth = self.information(a, b) / 2 ** in_flight.count((a, b))
+                played = self.results.get('%s|%s' % (a, b), (0, 0))[0]
+                if best is None or (worth, -played) > best[0]:
+                    best = (worth, -played), (a, b)
+        return best[1]
+
+    def add_result(self, a, b, games, wins_a):
+        ra, rb = self.ratings[a], self.ratings[b]
+        new_a = glicko_update(ra['rating'], ra['rd'], rb['rating'], rb['rd'], games, wins_a)
+        new_b = glicko_update(rb['rating'], rb['rd'], ra['rating'], ra['rd'], games, games - wins_a)
+        ra['rating'], ra['rd'] = new_a
+        rb['rating'], rb['rd'] = new_b
+        ra['games'] += games
+        rb['games'] += games
+        ra['wins'] += wins_a
+        rb['wins'] += games - wins_a
+
+        entry = self.results.setdefault('%s|%s' % (a, b), [0, 0])
+        entry[0] += games
+        entry[1] += wins_a
+
+    def match(self, a, b):
+        # Work unit of tournament.play_chunk, with its own block of game numbers
+        unit = [self.factories[a], self.factories[b]], 0, 1, self.games, self.match_size, self.seed
+        self.games += self.match_size
+        return unit
+
+    def run(self, games, callback=None):
+        # Plays about `games` more games, `callback(league, a, b, games, wins_a)` after
+        # every match
+        matches = -(-games // self.match_size)
+        if self.processes == 1:
+            for m in range(matches):
+                a, b = self.next_pairing()
+                self.finish(a, b, play_chunk(self.match(a, b)), callback)
+            return
+
+        done = queue.Queue()
+        in_flight = []
+        with Pool(self.processes) as pool:
+            slots = self.processes or os.cpu_count()
+            started = 0
+            while started < matches or in_flight:
+                while started < matches and len(in_flight) < slots:
+                    pair = self.next_pairing(in_flight)
+                    in_flight.append(pair)
+                    pool.apply_async(play_chunk, (self.match(*pair),),
+                                     callback=lambda chunk, pair=pair: done.put((pair, chunk)),
+                                     error_callback=done.put)
+                    started += 1
+
+                result = done.get()
+                if isinstance(result, BaseException):
+                    raise result
+                pair, chunk = result
+                in_flight.remove(pair)
+                self.finish(pair[0], pair[1], chunk, callback)
+
+    def finish(self, a, b, chunk, callback):
+        i, j, count, wins_a = chunk[:4]
+        self.add_result(a, b, count, wins_a)
+        self.save()
+        if callback is not None:
+            callback(self, a, b, count, wins_a)
+
+    def standings(self):
+        # (name, rating, rd, games) of the registered strategies, best first
+        rows = [(name, entry['rating'], entry['rd'], entry['games'])
+                for name, entry in self.ratings.items() if name in self.factories]
+        return sorted(rows, key=lambda row: -row[1])
+
+    def print_standings(self):
+        for name, rating, rd, games in self.standings():
+            print('%-20s %7.1f +- %5.1f  %6d games' % (name, rating, 2 * rd, games))
+
+
+if __name__ == "__main__":
+    # python league.py league.json games: rates the built-in bots
+    league = League(sys.argv[1])
+    league.register('random', RandomPlayerStrategy)
+    league.register('expectimax-1', functools.partial(ExpectimaxPlayerStrategy, max_depth=1, time_ms=None))
+    league.register('expectimax-2', functools.partial(ExpectimaxPlayerStrategy, max_depth=2, time_ms=None))
+    league.register('mcts-200', functools.partial(MCTSPlayerStrategy, playouts=200))
+    league.run(int(sys.argv[2]), lambda league, a, b, games, wins: print('%s %d - %d %s' % (a, wins, games - wins, b)))
+    league.print_standings()
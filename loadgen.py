@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+
+class LoadClient:
+    # One connection playing games back to back against a server bot, picking uniformly
+    # random legal moves. Latencies are the round trips of move requests (the bot's answer
+    # included), in seconds.
+
+    def __init__(self, host, port, bot, seed):
+        self.host = host
+        self.port = port
+        self.bot = bot
+        self.rng = random.Random(seed)
+        self.latencies = []
+        self.games = 0
+        self.errors = 0
+
+    async def request(self, reader, writer, message):
+        writer.write(json.dumps(message).encode() + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        if 'error' in response:
+            self.errors += 1
+        return response
+
+    async def run(self, games):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            for g in range(games):
+                state = await self.request(reader, writer, {
+                    'op': 'new', 'bot': self.bot, 'seat': self.rng.choice((1, 2)), 'seed': self.rng.getrandbits(32)})
+                if 'error' in state:
+                    continue
+                game = state['game']
+                while 'final_scores' not in state and 'error' not in state:
+                    action = self.rng.choice(state['actions'])
+                    start = time.perf_counter()
+                    state = await self.request(reader, writer, {'op': 'move', 'game': game, 'action': action})
+                    self.latencies.append(time.perf_counter() - start)
+                await self.request(reader, writer, {'op': 'close', 'game': game})
+                self.games += 1
+        finally:
+            writer.close()
+
+
+async def run_load(host, port, clients, games, bot='random', seed=0):
+    # Runs `clients` concurrent connections playing `games` games each, returns a report
+    load = [LoadClient(host, port, bot, seed * 100003 + i) for i in range(clients)]
+    start = time.perf_counter()
+    await asyncio.gather(*(client.run(games) for client in load))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([t for client in load for t in client.latencies])
+    return {
+        'clients': clients,
+        'games': sum(client.games for client in load),
+        'moves': len(latencies),
+        'errors': sum(client.errors for client in load),
+        'seconds': elapsed,
+        'games_per_second': sum(client.games for client in load) / elapsed,
+        'moves_per_second': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) * 1e3 if len(latencies) else 0.0,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1e3 if len(latencies) else 0.0,
+        'max_ms': float(latencies.max()) * 1e3 if len(latencies) else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    # python loadgen.py [--clients 100] [--games 10] [--bot random]: plays against a running
+    # server.py and prints games per second and move latencies
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--bot', default='random')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args.host, args.port, args.clients, args.games, args.bot, args.seed))
+    print(json.dumps(report, indent=2))
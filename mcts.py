@@ -0,0 +1,439 @@
+import copy
+import math
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from jaipur import *
+from player import *
+
+
+def rollout_action(player, rng):
+    # Uniform over takes and sells, which needs no trade enumeration. Trades are only
+    # considered inside the tree.
+    hand = player.hand
+    market = player._game.market
+
+    options = []
+    if player._hand_size < MAX_HAND_SIZE:
+        options += [(TAKE, i) for i in range(N_COMMODITIES) if market[i] > 0]
+    for i in range(1, N_COMMODITIES):
+        if hand[i] > PRECIOUS[i]:
+            options.append((SELL, i, rng.randint(PRECIOUS[i] + 1, hand[i])))
+
+    if options:
+        return rng.choice(options)
+    return rng.choice(player.get_all_actions())
+
+
+class Node:
+    __slots__ = ('mover', 'zobrist', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, mover, game, rng):
+        self.mover = mover # tag of the player whose action led here
+        self.zobrist = game.zobrist
+        self.children = {}
+        self.untried = [] if game.winner is not None else list(game.player_turn.get_all_actions())
+        rng.shuffle(self.untried)
+        self.visits = 0
+        self.wins = 0
+
+
+class MCTSPlayerStrategy(PlayerStrategy):
+    # UCT over Player.get_all_actions with random rollouts played in place through
+    # Jaipur.apply/undo. The budget per move is time_ms milliseconds and/or a number of
+    # playouts, whichever runs out first. The subtree of the chosen action is kept and
+    # picked up again on the next move if the opponent's reply is found in it. All random
+    # choices come from the strategy's own generator, seeded with seed.
+
+    def __init__(self, time_ms=None, playouts=None, exploration=1.4, max_rollout_plies=300, seed=0):
+        if time_ms is None and playouts is None:
+            time_ms = 100
+        self.time_ms = time_ms
+        self.playouts = playouts
+        self.exploration = exploration
+        self.max_rollout_plies = max_rollout_plies
+        self.rng = random.Random(seed)
+
+        self._root = None
+        self._game = None
+
+    def choose_action(self, player):
+        game = player._game
+        root = self.find_root(game)
+
+        muted, game.muted = game.muted, True
+        try:
+            self.search(game, root)
+        finally:
+            game.muted = muted
+
+        action, child = max(root.children.items(), key=lambda item: item[1].visits)
+        self._root = child
+        self._game = game
+        return action
+
+    def find_root(self, game):
+        # Reuse the subtree reached by the opponent's reply to our last move
+        if self._game is game and self._root is not None:
+            for child in self._root.children.values():
+                if child.zobrist == game.zobrist:
+                    return child
+
+        return Node(game.opponent().tag, game, self.rng)
+
+    def search(self, game, root):
+        playouts = self.playouts
+        deadline = None if self.time_ms is None else time.perf_counter() + self.time_ms / 1000
+
+        n = 0
+        while True:
+            self.playout(game, root)
+            n += 1
+            if playouts is not None and n >= playouts:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        return n
+
+    def playout(self, game, root):
+        records = []
+        path = self.descend(game, root, records)
+        winner = self.rollout(game, records)
+
+        for record in reversed(records):
+            game.undo(record)
+
+        for node in path:
+            node.visits += 1
+            if node.mover == winner:
+                node.wins += 1
+
+    def descend(self, game, root, records):
+        # Selection and expansion, applying the actions to game and their records to records
+        node = root
+        path = [root]
+
+        while not node.untried and node.children:
+            action, node = self.select(node)
+            records.append(game.apply(action))
+            path.append(node)
+
+        if node.untried:
+            action = node.untried.pop()
+            mover = game.player_turn.tag
+            records.append(game.apply(action))
+            child = Node(mover, game, self.rng)
+            node.children[action] = child
+            path.append(child)
+
+        return path
+
+    def rollout(self, game, records):
+        plies = 0
+        while game.winner is None and plies < self.max_rollout_plies:
+            records.append(game.apply(rollout_action(game.player_turn, self.rng)))
+            plies += 1
+
+        if game.winner is not None:
+            return game.winner
+        # Cut off: call it for whoever has more points
+        return game._player1.tag if game._player1.score() > game._player2.score() else game._player2.tag
+
+    def select(self, node):
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+
+        best = None
+        best_value = -1.0
+        for action, child in node.children.items():
+            value = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best, best_value = (action, child), value
+        return best
+
+
+def detached(game):
+    # Copy of the game without the players' strategies, listeners or instruments, small enough
+    # to send to workers
+    memo = {id(game._player1.strategy): None, id(game._player2.strategy): None,
+            id(game.listeners): (), id(game.instruments): None}
+    memo.update((id(keys), keys) for keys in HAND_KEYS)
+    return copy.deepcopy(game, memo)
+
+
+def search_root(args):
+    # Worker side of root parallelism: an independent tree, returns its root visit counts
+    game, seed, time_ms, playouts, exploration, max_rollout_plies = args
+    strategy = MCTSPlayerStrategy(time_ms, playouts, exploration, max_rollout_plies, seed)
+    root = Node(game.opponent().tag, game, strategy.rng)
+    strategy.search(game, root)
+    return {action: child.visits for action, child in root.children.items()}
+
+
+def rollout_leaf(args):
+    # Worker side of tree parallelism: rollouts from a leaf, returns the wins of each player
+    game, seed, rollouts, max_rollout_plies = args
+    strategy = MCTSPlayerStrategy(playouts=rollouts, max_rollout_plies=max_rollout_plies, seed=seed)
+
+    wins = {game._player1.tag: 0, game._player2.tag: 0}
+    for i in range(rollouts):
+        records = []
+        wins[strategy.rollout(game, records)] += 1
+        for record in reversed(records):
+            game.undo(record)
+    return wins
+
+
+class ParallelMCTSPlayerStrategy(MCTSPlayerStrategy):
+    # Spreads the per-move budget over a process pool.
+    # mode='root': every worker grows its own tree from the current position for the whole
+    #   time budget (or its share of the playouts) and root visit counts are summed.
+    # mode='tree': one tree in this process; batches of leaves are selected with a virtual
+    #   loss on their paths and their rollouts (rollouts_per_leaf each) run in the workers.
+    #   The tree is reused between moves like MCTSPlayerStrategy.
+    # Call close() to shut the pool down.
+
+    def __init__(self, processes=None, mode='root', time_ms=None, playouts=None, exploration=1.4,
+                 max_rollout_plies=300, batch_size=None, rollouts_per_leaf=4, seed=0):
+        super().__init__(time_ms, playouts, exploration, max_rollout_plies, seed)
+        if mode not in ('root', 'tree'):
+            raise ValueError('mode must be root or tree')
+        self.processes = processes or os.cpu_count()
+        self.mode = mode
+        self.batch_size = batch_size or 2 * self.processes
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = state['_root'] = state['_game'] = None
+        return state
+
+    def pool(self):
+        if self._pool is None:
+            self._pool = Pool(self.processes)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def choose_action(self, player):
+        if self.mode == 'tree':
+            return super().choose_action(player)
+
+        game = detached(player._game)
+        game.muted = True
+        playouts = None if self.playouts is None else max(1, self.playouts // self.processes)
+        jobs = [(game, self.rng.getrandbits(64), self.time_ms, playouts, self.exploration, self.max_rollout_plies)
+                for i in range(self.processes)]
+
+        visits = {}
+        for result in self.pool().imap_unordered(search_root, jobs):
+            for action, n in result.items():
+                visits[action] = visits.get(action, 0) + n
+        return max(visits, key=visits.get)
+
+    def search(self, game, root):
+        # Tree parallel search, used by MCTSPlayerStrategy.choose_action in 'tree' mode
+        playouts = self.playouts
+        deadline = None if self.time_ms is None else time.perf_counter() + self.time_ms / 1000
+        pool = self.pool()
+
+        n = 0
+        while True:
+            paths = []
+            jobs = []
+            terminal = 0
+            for i in range(self.batch_size):
+                records = []
+                path = self.descend(game, root, records)
+                # Virtual loss: count the pending rollouts as lost visits until they are back
+                for node in path:
+                    node.visits += 1
+
+                if game.winner is not None:
+                    self.backup(path, {game.winner: 1}, 1)
+                    terminal += 1
+                else:
+                    paths.append(path)
+                    jobs.append((detached(game), self.rng.getrandbits(64), self.rollouts_per_leaf, self.max_rollout_plies))
+
+                for record in reversed(records):
+                    game.undo(record)
+
+            for path, wins in zip(paths, pool.map(rollout_leaf, jobs)):
+                self.backup(path, wins, self.rollouts_per_leaf)
+
+            n += len(jobs) * self.rollouts_per_leaf + terminal
+            if playouts is not None and n >= playouts:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        return n
+
+    def backup(self, path, wins, visits):
+        # The virtual visit already counted one of the visits
+        for node in path:
+            node.visits += visits - 1
+            node.wins += wins.get(node.mover, 0)
+
+
+def observe(known, action):
+    # Updates the goods known to be in a player's hand (see determinize) with an action it
+    # played: goods taken from the market become known, goods sold or given away leave
+    # the known ones first, which keeps them a lower bound of the hand
+    if action[0] == Action.TAKE:
+        if action[1] is not None and action[1] != Commodity.CAMEL:
+            known[action[1]] += 1
+    elif action[0] == Action.SELL:
+        if action[1] is None:
+            # Sold whichever goods it held most of
+            known[:] = bytes(len(known))
+        else:
+            known[action[1]] = max(known[action[1]] - action[2], 0)
+    elif action[0] == Action.TRADE:
+        give, take = action[1]
+        for i in give:
+            if i != Commodity.CAMEL and known[i]:
+                known[i] -= 1
+        for i in take:
+            known[i] += 1
+
+
+def determinize(game, observer, rng, known=None):
+    # Deals the cards observer cannot see again: the deck order and the opponent's goods.
+    # The opponent's hand size and herd are public, and so are the goods of `known`
+    # (goods per commodity it is known to hold, see observe), so only the rest of its
+    # hand is dealt again from the unseen goods. The tokens left in the bonus piles are
+    # reshuffled too.
+    opponent = game.opponent(observer)
+    hand = opponent.hand
+    deck = game._deck
+    n = game.deck_size
+
+    unseen = bytearray(deck[:n].replace(b'\x00', b''))
+    camels = n - len(unseen)
+    held = opponent._hand_size
+    for i in GOODS:
+        keep = known[i] if known is not None else 0
+        unseen += bytes((i,)) * (hand[i] - keep)
+        hand[i] = keep
+        held -= keep
+
+    rng.shuffle(unseen)
+    for i in unseen[:held]:
+        hand[i] += 1
+
+    # CAMEL is 0, so bytes(camels) are the camels left in the deck
+    rest = unseen[held:] + bytes(camels)
+    rng.shuffle(rest)
+    deck[:n] = rest
+
+    for pile, left in zip(game._bonus, game.bonus_left):
+        tokens = pile[:left]
+        rng.shuffle(tokens)
+        pile[:left] = tokens
+
+    game.zobrist = game.compute_zobrist()
+
+
+class ISNode:
+    __slots__ = ('mover', 'children', 'visits', 'wins', 'avail')
+
+    def __init__(self, mover):
+        self.mover = mover # tag of the player whose action led here
+        self.children = {}
+        self.visits = 0
+        self.wins = 0
+        self.avail = 0
+
+
+class ISMCTSPlayerStrategy(MCTSPlayerStrategy):
+    # Single observer information set MCTS. Every playout searches a fresh determinization
+    # of the hidden deck order and opponent hand (see determinize) on a private copy of the
+    # game, and the statistics of an action are shared by every determinization where it is
+    # legal. Selection uses availability counts in place of parent visits. The search never
+    # looks at the real deck or the opponent's real hand, but follows the goods the opponent
+    # took in the open over the game (see observe). There is no tree reuse between moves.
+
+    def choose_action(self, player):
+        if self._game is not player._game:
+            self._game = player._game
+            self._opponent_goods = {}
+        # By observer, in case the strategy plays both seats
+        known = self._opponent_goods.setdefault(player.tag, bytearray(N_COMMODITIES))
+        last = player._game.opponent(player).last_action
+        if last is not None:
+            observe(known, last)
+
+        game = detached(player._game)
+        game.muted = True
+        self._observer = game.player_turn
+        self._known = known
+
+        root = ISNode(game.opponent().tag)
+        self.search(game, root)
+
+        self._observer = self._known = None
+        action, child = max(root.children.items(), key=lambda item: item[1].visits)
+        return action
+
+    def playout(self, game, root):
+        determinize(game, self._observer, self.rng, self._known)
+
+        records = []
+        path = self.descend(game, root, records)
+        winner = self.rollout(game, records)
+
+        for record in reversed(records):
+            game.undo(record)
+
+        for node in path:
+            node.visits += 1
+            if node.mover == winner:
+                node.wins += 1
+
+    def descend(self, game, root, records):
+        node = root
+        path = [root]
+
+        while game.winner is None:
+            legal = game.player_turn.get_all_actions()
+            mover = game.player_turn.tag
+
+            untried = [action for action in legal if action not in node.children]
+            if untried:
+                action = self.rng.choice(untried)
+                for other in legal:
+                    if other in node.children:
+                        node.children[other].avail += 1
+                child = ISNode(mover)
+                child.avail = 1
+                node.children[action] = child
+                records.append(game.apply(action))
+                path.append(child)
+                break
+
+            action, node = self.select_available(node, legal)
+            records.append(game.apply(action))
+            path.append(node)
+
+        return path
+
+    def select_available(self, node, legal):
+        exploration = self.exploration
+        children = node.children
+
+        best = None
+        best_value = -1.0
+        for action in legal:
+            child = children[action]
+            child.avail += 1
+            value = child.wins / child.visits + exploration * math.sqrt(math.log(child.avail) / child.visits)
+            if value > best_value:
+                best, best_value = (action, child), value
+        return best
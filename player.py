@@ -1,127 +1,96 @@
-import random
 from enum import Enum, IntEnum, unique
 from itertools import cycle, combinations, product
-from collections import Counter
 import numpy as np
 import copy
 import pickle
 
 from jaipur import *
+from actions import *
 
 class Player:
+    __slots__ = ('tag', 'strategy', 'hand', '_hand_size', 'hand_keys', 'tokens', 'final_score', 'last_action', '_game')
 
     def __init__(self, strategy, tag, game):
         self.tag = tag
         self.strategy = strategy
 
-        self.camel_count = 0
-
-        self.hand = Counter()
-        for i in Commodity:
-            self.hand[i] = 0
+        # hand[CAMEL] is the herd, _hand_size counts the goods only
+        self.hand = bytearray(N_COMMODITIES)
+        self._hand_size = 0
+        # Zobrist keys for this seat, set by Jaipur
+        self.hand_keys = HAND_KEYS[0]
 
         self.tokens = []
         self.final_score = 0
+        self.last_action = None
 
         self._game = game
 
+    @property
+    def camel_count(self):
+        return self.hand[Commodity.CAMEL]
+
+    @camel_count.setter
+    def camel_count(self, count):
+        self.hand[Commodity.CAMEL] = count
+
+    def add_hand(self, commodity, count):
+        n = self.hand[commodity]
+        self.hand[commodity] = n + count
+        self._game.zobrist ^= self.hand_keys[commodity][n] ^ self.hand_keys[commodity][n + count]
 
     def hand_size(self):
-        return sum(self.hand.values())
+        return self._hand_size
 
     def score(self):
         return sum(self.tokens)
 
     def get_possible_trades(self, give_commodities, take_commodities):
-        # print('give commodities', give_commodities)
-        # print('take commodities', take_commodities)
-
-        if len(give_commodities) < 2 or len(take_commodities) < 2:
-            return []
-
-        give_commodities = sorted(give_commodities)
-        take_commodities = sorted(take_commodities)
-
-        possible_trades = []
-
-        for trade_size in range(2, min(len(give_commodities), len(take_commodities)) + 1):
-            give_subsets = set(combinations(give_commodities, trade_size))
-            take_subsets = set(combinations(take_commodities, trade_size))
+        give = bytearray(N_COMMODITIES)
+        for i in give_commodities:
+            give[i] += 1
 
-            all_combinations = product(give_subsets, take_subsets)
+        take = bytearray(N_COMMODITIES)
+        for i in take_commodities:
+            take[i] += 1
 
-            for give, take in all_combinations:
-                if len(set(give).intersection(set(take))) == 0:
-                    possible_trades += [(give, take)]
-
-        return possible_trades
+        return possible_trades(give, take)
 
     def get_all_actions(self):
-        take_commodities = [i for i in self._game.market if self._game.market[i] > 0]
-        sell_commodities = [i for i in self.hand if (self.hand[i] > 1) or (not Commodity.is_precious(i) and self.hand[i] > 0)]
-
-        all_actions = []
-        if self.hand_size() < 7:
-            all_actions += [(Action.TAKE, i) for i in take_commodities]
-
-        for commodity in sell_commodities:
-            precious = Commodity.is_precious(commodity)
-            for i in range(precious, self.hand[commodity]):
-                all_actions += [(Action.SELL, commodity, i + 1)]
-
-        commodities_to_give = []
-        for i in self.hand:
-            commodities_to_give += [i] * self.hand[i]
-        commodities_to_give += [Commodity.CAMEL] * self.camel_count
-
-        commodities_to_take = []
-        for i in self._game.market:
-            if i != Commodity.CAMEL:
-                commodities_to_take += [i] * self._game.market[i]
-
-        possible_trades = self.get_possible_trades(commodities_to_give, commodities_to_take)
-        all_actions += [(Action.TRADE, i) for i in possible_trades]
-
-        return all_actions
+        # Shared cached tuple, do not modify
+        return ACTION_CACHE.get(self.hand, self._game.market)
 
 
     def take(self, commodity=None):
-        if not self._game.muted:
-            print('taking..', commodity)
-
-        if self.hand_size() < 7:
+        if self._hand_size < MAX_HAND_SIZE:
             taken, take_count = self._game.pick_commodity(commodity)
-            if taken == Commodity.CAMEL:
-                self.camel_count += take_count
-            else:
-                self.hand[taken] += take_count
+            if taken is None:
+                return
 
-    def sell(self, commodity, count):
-        if not self._game.muted:
-            print('selling..', commodity)
+            self.add_hand(taken, take_count)
+            if taken != Commodity.CAMEL:
+                self._hand_size += take_count
 
+    def sell(self, commodity, count):
+        hand = self.hand
         if commodity is None:
-            commodity = self.hand.most_common(1)[0][0]
+            commodity = max(GOODS, key=hand.__getitem__)
 
-        if ((not Commodity.is_precious(commodity)) and self.hand[commodity] > 0) or self.hand[commodity] > 1:
-            for i in range(count):
-                if self._game.price_tokens[commodity]:
-                    self.tokens.append(self._game.price_tokens[commodity].pop())
+        if hand[commodity] > PRECIOUS[commodity]:
+            self.add_hand(commodity, -count)
+            self._hand_size -= count
 
-            self.hand[commodity] -= count
+            for i in range(count):
+                token = self._game.pop_token(commodity)
+                if token is not None:
+                    self.tokens.append(token)
 
-            #TODO use tokens pile instead of random 
-            if count == 3:
-                self.tokens.append(random.randint(1, 4))
-            elif count == 4:
-                self.tokens.append(random.randint(4, 7))
-            elif count >= 5:
-                self.tokens.append(random.randint(7, 11))
+            if count >= 3:
+                token = self._game.pop_bonus(count)
+                if token is not None:
+                    self.tokens.append(token)
 
     def trade(self, give=None, take=None):
-        if not self._game.muted:
-            print('trading..', (give, take))
-
         if give == None or take == None:
             return
         
@@ -134,20 +103,27 @@ class Player:
         if(set(give).intersection(set(take))):
             return
 
-        give = Counter(give)
-        take = Counter(take)
+        game = self._game
+        for i in give:
+            self.add_hand(i, -1)
+            game.add_market(i, 1)
 
-        self.hand -= give
-        self._game.market += give
+        for i in take:
+            game.add_market(i, -1)
+            self.add_hand(i, 1)
 
-        self._game.market -= take
-        self.hand += take
-
-        self.camel_count -= give[Commodity.CAMEL]
+        # Goods received replace goods given, camels given grow the hand
+        self._hand_size += give.count(Commodity.CAMEL)
 
 
     def do_action(self, winner):
         action = self.strategy.choose_action(self)
+        self.last_action = action
+        self.play(action)
+
+        return self._game
+
+    def play(self, action):
         if action[0] == Action.TAKE:
             self.take(action[1])
         elif action[0] == Action.SELL:
@@ -155,8 +131,6 @@ class Player:
         elif action[0] == Action.TRADE:
             self.trade(action[1][0], action[1][1])
 
-        return self._game
-
 
 class PlayerStrategy:
     def choose_action(self, player):
@@ -166,7 +140,7 @@ class PlayerStrategy:
 class RandomPlayerStrategy(PlayerStrategy):
     def choose_action(self, player):
         all_actions = player.get_all_actions()
-        return random.choice(all_actions)
+        return player._game.rng.choice(all_actions)
 
 
 class InteractivePlayerStrategy(PlayerStrategy):
@@ -196,7 +170,7 @@ class BalancedPlayerStrategy(PlayerStrategy):
         player_goods = player.hand
 
         # Calculate the average value of the goods in the market
-        goods_values = [good.value for good in available_goods]
+        goods_values = [good.value for good in Commodity]
         average_value = sum(goods_values) / len(goods_values)
 
         # Weights for the different actions
@@ -223,7 +197,7 @@ class BalancedPlayerStrategy(PlayerStrategy):
         sell_goods_weight /= total_weight
 
         # Choose an action based on the weights
-        random_value = random.random()
+        random_value = player._game.rng.random()
         if random_value < take_goods_weight:
             return 'take_goods'
         elif random_value < take_goods_weight + take_camels_weight:
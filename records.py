@@ -0,0 +1,170 @@
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+from jaipur import *
+from player import *
+
+# A record file is MAGIC followed by game records, each a RECORD header and `plies`
+# little-endian uint32 ply codes. Files are only ever appended to.
+MAGIC = b'JAIPUR\x00\x02'
+BONUS_SIZE = sum(len(i) for i in BONUS_TOKENS)
+# seed, winner, P1 and P2 final scores, deck, bonus piles one after the other, plies
+RECORD = struct.Struct('<QBhh%ds%dsH' % (len(DECK), BONUS_SIZE))
+
+# Ply codes: bits 0-1 hold the Action.
+#   TAKE:  bits 2-4 the commodity
+#   SELL:  bits 2-4 the commodity, bits 5-8 the count
+#   TRADE: bits 2-16 up to five given cards, bits 17-31 up to five taken cards, 3 bits each,
+#          NO_CARD past the last one
+NO_CARD = 7
+TRADE_SLOTS = 5
+
+GameRecord = namedtuple('GameRecord', 'seed winner scores deck bonus plies')
+
+
+def split_bonus(bonus):
+    # The three bonus piles of a record
+    piles = []
+    start = 0
+    for i in BONUS_TOKENS:
+        piles.append(bonus[start:start + len(i)])
+        start += len(i)
+    return piles
+
+
+def encode_ply(action):
+    kind = action[0]
+    if kind == Action.TAKE:
+        return kind | action[1] << 2
+    if kind == Action.SELL:
+        return kind | action[1] << 2 | action[2] << 5
+
+    give, take = action[1]
+    code = kind
+    for i in range(TRADE_SLOTS):
+        code |= (give[i] if i < len(give) else NO_CARD) << 2 + 3 * i
+        code |= (take[i] if i < len(take) else NO_CARD) << 17 + 3 * i
+    return code
+
+
+def decode_ply(code):
+    # The action as Player.get_all_actions spells it
+    kind = code & 3
+    if kind == Action.TAKE:
+        return (TAKE, code >> 2 & 7)
+    if kind == Action.SELL:
+        return (SELL, code >> 2 & 7, code >> 5 & 15)
+
+    give = tuple(c for c in (code >> 2 + 3 * i & 7 for i in range(TRADE_SLOTS)) if c != NO_CARD)
+    take = tuple(c for c in (code >> 17 + 3 * i & 7 for i in range(TRADE_SLOTS)) if c != NO_CARD)
+    return (TRADE, (give, take))
+
+
+class GameRecorder(GameListener):
+    # Collects the plies of the games it listens to (Jaipur(..., listeners=[recorder])) and
+    # passes each finished game on to add_game as a GameRecord. Games without a seed are
+    # recorded with seed 0.
+
+    def __init__(self):
+        self.games = 0
+        self._plies = {}
+
+    def move_applied(self, game, player, action):
+        plies = self._plies.get(game)
+        if plies is None:
+            plies = self._plies[game] = array('I')
+        plies.append(encode_ply(action))
+
+    def game_ended(self, game):
+        winner = 1 if game.winner == game._player1.tag else 2
+        record = GameRecord(game.seed or 0, winner, (game._player1.final_score, game._player2.final_score),
+                            bytes(game._deck), b''.join(game._bonus), self._plies.pop(game, array('I')))
+        self.games += 1
+        self.add_game(record)
+
+    def add_game(self, record):
+        raise NotImplementedError
+
+
+class GameWriter(GameRecorder):
+    # Appends the games it records to a record file, each one in a single write
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def add_game(self, record):
+        plies = record.plies
+        if sys.byteorder != 'little':
+            plies = array('I', plies)
+            plies.byteswap()
+        header = RECORD.pack(record.seed, record.winner, record.scores[0], record.scores[1],
+                             record.deck, record.bonus, len(plies))
+        self.file.write(header + plies.tobytes())
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_games(path, offset=None):
+    # Streams the GameRecords of a file, from byte offset `offset` if given.
+    # A game cut short at the end of the file (a writer still running) is skipped.
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a game record file' % path)
+        if offset is not None:
+            f.seek(offset)
+
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            seed, winner, score1, score2, deck, bonus, n = RECORD.unpack(header)
+
+            data = f.read(4 * n)
+            if len(data) < 4 * n:
+                return
+            plies = array('I')
+            plies.frombytes(data)
+            if sys.byteorder != 'little':
+                plies.byteswap()
+            yield GameRecord(seed, winner, (score1, score2), deck, bonus, plies)
+
+
+def replay_player(tag, game):
+    return Player(None, tag, game)
+
+
+def replay(record):
+    # Plays a recorded game again through the engine, yielding the game before every ply
+    # and once more at the end. The same Jaipur object is updated in place.
+    game = Jaipur(replay_player, replay_player, muted=True, deck=record.deck, bonus=split_bonus(record.bonus))
+    for code in record.plies:
+        yield game
+        game.apply(decode_ply(code))
+    yield game
+
+
+if __name__ == "__main__":
+    # python records.py file.jpr: prints a summary of the games in a record file
+    games = plies = 0
+    wins = [0, 0]
+    for record in read_games(sys.argv[1]):
+        games += 1
+        plies += len(record.plies)
+        wins[record.winner - 1] += 1
+    print(games, 'games,', plies, 'plies, P1 won', wins[0], 'P2 won', wins[1])
@@ -0,0 +1,238 @@
+import hashlib
+import random
+import time
+
+from jaipur import *
+from player import *
+from mcts import detached
+
+EXACT, LOWER, UPPER = range(3)
+INFINITY = float('inf')
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def terminal_value(game):
+    # Value of a finished game for the player to move: nothing left to gain but the camel bonus
+    camels = game.player_turn.camel_count - game.opponent().camel_count
+    return 5 if camels > 0 else -5 if camels < 0 else 0
+
+
+def chance_key(game):
+    # 64-bit hash of what is left in the deck and in the bonus piles, as multisets (the
+    # zobrist key only covers how many cards and tokens are left)
+    key = bytearray(sorted(game._deck[:game.deck_size]))
+    for pile, left in zip(game._bonus, game.bonus_left):
+        key.append(255)
+        key += bytes(sorted(pile[:left]))
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def top_card_expectation(cards, n, value):
+    # Exact expectation of value() over the next card drawn from cards[:n], the one at
+    # position n - 1: a card of each kind left is put there in turn, and the order is
+    # restored afterwards
+    expected = 0.0
+    for kind in set(cards[:n]):
+        i = cards.index(kind, 0, n)
+        cards[i], cards[n - 1] = cards[n - 1], cards[i]
+        try:
+            v = value()
+        finally:
+            cards[i], cards[n - 1] = cards[n - 1], cards[i]
+        expected += cards.count(kind, 0, n) / n * v
+    return expected
+
+
+class ExpectimaxPlayerStrategy(PlayerStrategy):
+    # Depth-limited expectimax with alpha-beta at decision nodes, iterative deepening and a
+    # fixed-size always-replace transposition table keyed on Jaipur.zobrist and chance_key.
+    # The table and the generator are reset when a new game starts, so a game is played
+    # the same whatever the strategy searched before it.
+    #
+    # Values are the points the player to move will still gain minus the opponent's (plus the
+    # camel bonus when the game ends), so they do not depend on the scores so far and can be
+    # shared through the table. Refilling the market is a chance node over the cards left in
+    # the deck: one drawn card is enumerated exactly by moving a card of each kind to the top
+    # of the deck, several drawn cards (taking camels) are averaged over `samples` shuffles.
+    # Bonus tokens only add points, so sells count their expected value over the tokens left
+    # in their pile.
+    #
+    # With time_ms set the best move of the deepest finished iteration is returned when time
+    # runs out (or the best move found so far in the current one). Without it the search is
+    # deterministic, which makes it a reference bot for regression tests.
+
+    def __init__(self, max_depth=4, time_ms=200, samples=3, table_bits=18, seed=0):
+        self.max_depth = max_depth
+        self.time_ms = time_ms
+        self.samples = samples
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        self.mask = (1 << table_bits) - 1
+        self.table = [None] * (1 << table_bits)
+        self._game = None
+
+        self.nodes = 0
+        self.depth_reached = 0
+        self.deadline = None
+
+    def choose_action(self, player):
+        if self._game is not player._game:
+            self._game = player._game
+            self.table = [None] * len(self.table)
+            self.rng.seed(self.seed)
+
+        game = detached(player._game)
+        game.muted = True
+
+        self.nodes = 0
+        self.deadline = None if self.time_ms is None else time.perf_counter() + self.time_ms / 1000
+
+        best = None
+        for depth in range(1, self.max_depth + 1):
+            self.partial = None
+            try:
+                best = self.search_root(game, depth, best)
+            except SearchTimeout:
+                if self.partial is not None:
+                    best = self.partial
+                break
+            self.depth_reached = depth
+
+        if best is None:
+            best = game.player_turn.get_all_actions()[0]
+        return best
+
+    def search_root(self, game, depth, previous_best):
+        best_value = -INFINITY
+        alpha = -INFINITY
+        for action in self.ordered_actions(game, previous_best):
+            value = self.action_value(game, action, depth, alpha, INFINITY)
+            if value > best_value:
+                best_value = value
+                self.partial = action
+            alpha = max(alpha, value)
+        return self.partial
+
+    def negamax(self, game, depth, alpha, beta):
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & 255 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        if game.winner is not None:
+            return terminal_value(game)
+        if depth == 0:
+            return self.evaluate(game)
+
+        key = game.zobrist ^ chance_key(game)
+        entry = self.table[key & self.mask]
+        table_action = None
+        if entry is not None and entry[0] == key:
+            table_action = entry[4]
+            if entry[1] >= depth:
+                flag, value = entry[2], entry[3]
+                if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                    return value
+
+        original_alpha = alpha
+        best_value = -INFINITY
+        best_action = None
+        for action in self.ordered_actions(game, table_action):
+            value = self.action_value(game, action, depth, alpha, beta)
+            if value > best_value:
+                best_value, best_action = value, action
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[key & self.mask] = (key, depth, flag, best_value, best_action)
+        return best_value
+
+    def action_value(self, game, action, depth, alpha, beta):
+        gain = self.gain(game, action)
+
+        draws = 0
+        if action[0] == Action.TAKE:
+            draws = game.market[Commodity.CAMEL] if action[1] == Commodity.CAMEL else 1
+            draws = min(draws, game.deck_size)
+
+        if draws == 0:
+            record = game.apply(action)
+            try:
+                return gain - self.negamax(game, depth - 1, gain - beta, gain - alpha)
+            finally:
+                game.undo(record)
+
+        # Chance node, searched with a full window
+        deck = game._deck
+        n = game.deck_size
+        expected = 0.0
+
+        if draws == 1:
+            expected = top_card_expectation(deck, n, lambda: self.child_value(game, action, depth))
+        else:
+            saved = deck[:n]
+            try:
+                for s in range(self.samples):
+                    shuffled = bytearray(saved)
+                    self.rng.shuffle(shuffled)
+                    deck[:n] = shuffled
+                    expected += self.child_value(game, action, depth) / self.samples
+            finally:
+                deck[:n] = saved
+
+        return gain - expected
+
+    def child_value(self, game, action, depth):
+        # Full window value of the position after action, for the chance nodes
+        record = game.apply(action)
+        try:
+            return self.negamax(game, depth - 1, -INFINITY, INFINITY)
+        finally:
+            game.undo(record)
+
+    def gain(self, game, action):
+        if action[0] != Action.SELL:
+            return 0
+
+        commodity, count = action[1], action[2]
+        left = game.tokens_left[commodity]
+        return sum(PRICE_TOKENS[commodity][max(left - count, 0):left]) + game.bonus_expectation(count)
+
+    def evaluate(self, game):
+        # Half of what each hand would fetch at the current top tokens, and half the camel bonus
+        player = game.player_turn
+        opponent = game.opponent()
+        value = 0.0
+        for i in GOODS:
+            left = game.tokens_left[i]
+            top = PRICE_TOKENS[i][left - 1] if left else 0
+            value += 0.5 * top * (player.hand[i] - opponent.hand[i])
+
+        camels = player.camel_count - opponent.camel_count
+        return value + (2.5 if camels > 0 else -2.5 if camels < 0 else 0)
+
+    def ordered_actions(self, game, first=None):
+        # Best move from the table first, then sells by value, takes by top token, trades
+        tokens_left = game.tokens_left
+
+        def order(action):
+            if action == first:
+                return 1000
+            if action[0] == Action.SELL:
+                return 100 + self.gain(game, action)
+            if action[0] == Action.TAKE:
+                left = tokens_left[action[1]]
+                return 10 + (PRICE_TOKENS[action[1]][left - 1] if left else 0)
+            return 0
+
+        return sorted(game.player_turn.get_all_actions(), key=order, reverse=True)
@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from jaipur import *
+from player import *
+from search import ExpectimaxPlayerStrategy
+
+# Line-delimited JSON over TCP, one request object per line and one response line per
+# request, in order. Requests may carry an "id" that is echoed back. Actions are ids into
+# actions.ACTION_SPACE.
+#
+#   {"op": "new", "bot": "random", "seat": 1, "seed": 7}   start a game against a bot, the
+#                                                           client plays seat 1 or 2
+#   {"op": "move", "game": 3, "action": 125}               play a move, the bot answers
+#   {"op": "state", "game": 3}                             current state
+#   {"op": "close", "game": 3}                             forget a game
+#   {"op": "stats"}                                        server counters
+#
+# Game responses hold the state seen by the client (see view) and, after the bot moved,
+# "bot_action". Errors come back as {"error": message}. Games still open when their
+# connection closes are dropped.
+
+# Bots by name, built once per executor thread since search bots keep tables and are not
+# thread safe
+BOTS = {
+    'random': RandomPlayerStrategy,
+    'expectimax': lambda: ExpectimaxPlayerStrategy(max_depth=3, time_ms=20),
+}
+
+
+class RequestError(Exception):
+    pass
+
+
+class RemotePlayerStrategy(PlayerStrategy):
+    # Plays the move the client sent
+    def __init__(self):
+        self.action = None
+
+    def choose_action(self, player):
+        action, self.action = self.action, None
+        return action
+
+
+class BotStrategy(PlayerStrategy):
+    # Stands for the bot `name`, moves with the instance of the executor thread it runs on
+    _local = threading.local()
+
+    def __init__(self, name):
+        if not isinstance(name, str) or name not in BOTS:
+            raise RequestError('unknown bot %r' % (name,))
+        self.name = name
+
+    def choose_action(self, player):
+        bots = self._local.__dict__.setdefault('bots', {})
+        bot = bots.get(self.name)
+        if bot is None:
+            bot = bots[self.name] = BOTS[self.name]()
+        return bot.choose_action(player)
+
+
+class ServerGame:
+    def __init__(self, game_id, bot, seat, seed):
+        self.id = game_id
+        self.remote = RemotePlayerStrategy()
+        self.bot = BotStrategy(bot)
+        strategies = (self.remote, self.bot) if seat == 1 else (self.bot, self.remote)
+        self.game = Jaipur(lambda tag, game: Player(strategies[0], tag, game),
+                           lambda tag, game: Player(strategies[1], tag, game),
+                           muted=True, seed=seed)
+        self.client = self.game._player1 if seat == 1 else self.game._player2
+
+    def play(self):
+        # One turn of whoever is to move, called on the loop for the client and in the
+        # executor for the bot
+        self.game = self.game.switch_player()
+        self.game.game_winner()
+        return self.game.opponent().last_action
+
+    def view(self):
+        game = self.game
+        me = self.client
+        opponent = game.opponent(me)
+        state = {
+            'game': self.id,
+            'market': list(game.market),
+            'hand': list(me.hand),
+            'opponent_hand_size': opponent.hand_size(),
+            'opponent_camels': opponent.camel_count,
+            'tokens_left': list(game.tokens_left),
+            'bonus_left': list(game.bonus_left),
+            'deck_size': game.deck_size,
+            'scores': [me.score(), opponent.score()],
+            'your_turn': game.winner is None and game.player_turn is me,
+        }
+        if game.winner is not None:
+            state['final_scores'] = [me.final_score, opponent.final_score]
+            state['won'] = game.winner == me.tag
+        elif state['your_turn']:
+            state['actions'] = legal_ids(me.hand, game.market).tolist()
+        return state
+
+
+class GameServer:
+    # Hosts any number of games in memory on one event loop. The client's moves are applied
+    # on the loop (a move is a few microseconds), bot moves run on a thread pool so a slow
+    # bot never holds up other games. A game belongs to the connection that started it and
+    # each connection's requests are answered one at a time, so a game is never played
+    # from two threads at once.
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=4):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(workers)
+        self.games = {}
+        self._ids = itertools.count(1)
+        self.requests = 0
+        self.games_started = 0
+        self.games_finished = 0
+        self.connections = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=1 << 16)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.executor.shutdown(wait=False)
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.respond(line, owned)
+                writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # ValueError: a line over the reader's limit
+            pass
+        finally:
+            self.connections -= 1
+            for game_id in owned:
+                self.games.pop(game_id, None)
+            writer.close()
+
+    async def respond(self, line, owned):
+        self.requests += 1
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+                request_id = request.get('id')
+                op = request['op']
+            except (ValueError, KeyError, AttributeError):
+                raise RequestError('bad request')
+
+            if op == 'new':
+                response = await self.new_game(request, owned)
+            elif op == 'move':
+                response = await self.move(self.game(request, owned), request.get('action'))
+            elif op == 'state':
+                response = self.game(request, owned).view()
+            elif op == 'close':
+                owned.discard(self.game(request, owned).id)
+                self.games.pop(request['game'])
+                response = {'closed': request['game']}
+            elif op == 'stats':
+                response = self.stats()
+            else:
+                raise RequestError('unknown op %r' % op)
+        except RequestError as e:
+            response = {'error': str(e)}
+        except Exception as e:
+            # Whatever a request does wrong it gets an answer, and the connection stays up
+            response = {'error': 'internal error: %s: %s' % (type(e).__name__, e)}
+
+        if request_id is not None:
+            response['id'] = request_id
+        return response
+
+    def game(self, request, owned):
+        game_id = request.get('game')
+        if not isinstance(game_id, int) or game_id not in owned:
+            raise RequestError('no game %r' % game_id)
+        return self.games[game_id]
+
+    async def new_game(self, request, owned):
+        seat = request.get('seat', 1)
+        if seat not in (1, 2):
+            raise RequestError('seat must be 1 or 2')
+        seed = request.get('seed')
+        if seed is not None and not isinstance(seed, int):
+            raise RequestError('seed must be an integer')
+        game = ServerGame(next(self._ids), request.get('bot', 'random'), seat, seed)
+        self.games[game.id] = game
+        owned.add(game.id)
+        self.games_started += 1
+
+        response = {}
+        if seat == 2:
+            response['bot_action'] = await self.bot_move(game)
+        response.update(game.view())
+        return response
+
+    async def move(self, game, action_id):
+        if game.game.winner is not None or game.game.player_turn is not game.client:
+            raise RequestError('not your turn')
+        if not isinstance(action_id, int) or action_id not in legal_ids(game.client.hand, game.game.market):
+            raise RequestError('illegal action %r' % (action_id,))
+
+        game.remote.action = ACTION_SPACE[action_id]
+        game.play()
+        response = {}
+        if game.game.winner is None:
+            response['bot_action'] = await self.bot_move(game)
+        else:
+            self.games_finished += 1
+        response.update(game.view())
+        return response
+
+    async def bot_move(self, game):
+        action = await asyncio.get_running_loop().run_in_executor(self.executor, game.play)
+        if game.game.winner is not None:
+            self.games_finished += 1
+        return ACTION_IDS[action]
+
+    def stats(self):
+        return {
+            'games': len(self.games),
+            'games_started': self.games_started,
+            'games_finished': self.games_finished,
+            'connections': self.connections,
+            'requests': self.requests,
+        }
+
+
+if __name__ == "__main__":
+    # python server.py [--port 8765] [--workers 4]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    server = GameServer(args.host, args.port, args.workers)
+    print('serving on %s:%d' % (args.host, args.port))
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,46 @@
+import numpy as np
+
+from jaipur import *
+from player import *
+from actions import *
+
+
+def positions(seeds=range(8)):
+    for seed in seeds:
+        game = Jaipur(lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                      lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                      muted=True, seed=seed)
+        while game.winner is None:
+            yield game
+            game = game.switch_player()
+            game.game_winner()
+
+
+def test_legal_ids_decode_to_get_all_actions():
+    for game in positions():
+        player = game.player_turn
+        actions = player.get_all_actions()
+        assert [ACTION_SPACE[i] for i in legal_ids(player.hand, game.market)] == list(actions)
+        # numpy rows give the same ids as the bytearrays
+        hand = np.frombuffer(player.hand, dtype=np.uint8).astype(np.int8)
+        market = np.frombuffer(game.market, dtype=np.uint8).astype(np.int8)
+        assert (legal_ids(hand, market) == legal_ids(player.hand, game.market)).all()
+        assert ACTION_CACHE.get(hand, market) == actions
+
+        kind, commodity, count, give, take = decode_actions(legal_ids(hand, market))
+        assert kind.tolist() == [action[0] for action in actions]
+
+
+def test_legal_masks_match_legal_mask():
+    hands = []
+    markets = []
+    for game in positions():
+        hands.append(bytes(game.player_turn.hand))
+        markets.append(bytes(game.market))
+    hands = np.frombuffer(b''.join(hands), dtype=np.uint8).reshape(-1, N_COMMODITIES).astype(np.int8)
+    markets = np.frombuffer(b''.join(markets), dtype=np.uint8).reshape(-1, N_COMMODITIES).astype(np.int8)
+
+    masks = legal_masks(hands, markets)
+    assert masks.shape == (len(hands), N_ACTIONS)
+    expected = np.stack([legal_mask(hand, market) for hand, market in zip(hands, markets)])
+    assert (masks == expected).all()
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from jaipur import *
+from player import *
+from batch import *
+
+
+class ScriptedBatchStrategy(BatchStrategy):
+    # Plays the actions set in `actions` (tuples, one per active game)
+    def __init__(self):
+        self.actions = None
+
+    def choose_actions(self, batch, rows):
+        return encode_actions(self.actions)
+
+
+def new_game(seed):
+    return Jaipur(lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                  lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                  muted=True, seed=seed)
+
+
+def assert_same(batch, games):
+    for i, game in enumerate(games):
+        assert bytes(batch.market[i].astype(np.uint8)) == bytes(game.market)
+        assert batch.market_size[i] == game.market_size
+        assert bytes(batch.tokens_left[i].astype(np.uint8)) == bytes(game.tokens_left)
+        assert batch.empty_stacks[i] == game.empty_stacks
+        assert batch.deck_size[i] == game.deck_size
+        assert bytes(batch.bonus_left[i].astype(np.uint8)) == bytes(game.bonus_left)
+        for p, player in enumerate((game._player1, game._player2)):
+            assert bytes(batch.hands[i, p].astype(np.uint8)) == bytes(player.hand)
+            assert batch.hand_size[i, p] == player.hand_size()
+            assert batch.points[i, p] == player.score()
+        assert batch.done[i] == (game.winner is not None)
+        if game.winner is not None:
+            assert batch.winner[i] == (0 if game.winner == game._player1.tag else 1)
+            assert batch.final_score[i, 0] == game._player1.final_score
+            assert batch.final_score[i, 1] == game._player2.final_score
+
+
+def test_batch_matches_scalar_engine():
+    games = [new_game(seed) for seed in range(32)]
+    batch = BatchJaipur.from_games(games)
+    strategy = ScriptedBatchStrategy()
+    assert_same(batch, games)
+
+    while not batch.done.all():
+        rows = batch.active()
+        strategy.actions = [games[i].rng.choice(games[i].player_turn.get_all_actions()) for i in rows]
+        for i, action in zip(rows, strategy.actions):
+            games[i].apply(action)
+        batch.step(strategy)
+        assert_same(batch, games)
+
+
+def test_from_games_rejects_mixed_turns():
+    games = [new_game(0), new_game(1)]
+    games[1].apply(games[1].player_turn.get_all_actions()[0])
+    with pytest.raises(ValueError):
+        BatchJaipur.from_games(games)
@@ -0,0 +1,58 @@
+from jaipur import *
+from player import *
+from endgame import *
+
+
+def empty_deck_positions(seeds=range(40)):
+    # Positions of seeded random games where the deck just ran out and trades are legal
+    for seed in seeds:
+        game = Jaipur(lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                      lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                      muted=True, seed=seed)
+        while game.winner is None and game.deck_size > 0:
+            game = game.switch_player()
+            game.game_winner()
+        if game.winner is None and any(a[0] == Action.TRADE for a in game.player_turn.get_all_actions()):
+            yield game
+
+
+def test_no_trade_after_max_trades():
+    solved = 0
+    for game in empty_deck_positions():
+        solver = EndgameSolver(max_trades=1, max_nodes=5000)
+        try:
+            values = solver.action_values(game, trades=1)
+        except EndgameTooLarge:
+            continue
+        solved += 1
+        assert not any(action[0] == Action.TRADE for action in values)
+        assert solver.best_action(game, trades=1)[0][0] != Action.TRADE
+    assert solved
+
+
+class RecordingSolver(EndgameSolver):
+    # Records the trades it is given and always gives up
+    def __init__(self):
+        super().__init__()
+        self.given = []
+
+    def best_action(self, game, trades=0):
+        self.given.append(trades)
+        raise EndgameTooLarge
+
+
+def test_strategy_passes_trades_in_a_row():
+    solver = RecordingSolver()
+    strategy = EndgamePlayerStrategy(max_deck=len(DECK), solver=solver)
+    game = Jaipur(lambda tag, game: Player(strategy, tag, game),
+                  lambda tag, game: Player(strategy, tag, game),
+                  muted=True, seed=5)
+    expected = []
+    trades = 0
+    while game.winner is None:
+        expected.append(min(trades, solver.max_trades))
+        game = game.switch_player()
+        trades = trades + 1 if game.opponent().last_action[0] == Action.TRADE else 0
+        game.game_winner()
+    assert solver.given == expected
+    assert max(expected) == solver.max_trades
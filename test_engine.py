@@ -0,0 +1,58 @@
+import random
+
+from jaipur import *
+from player import *
+
+
+def new_game(seed):
+    return Jaipur(lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                  lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                  muted=True, seed=seed)
+
+
+def positions(seeds=range(8)):
+    # Every position of seeded random games, the game object moving on between yields
+    for seed in seeds:
+        game = new_game(seed)
+        while game.winner is None:
+            yield game
+            game = game.switch_player()
+            game.game_winner()
+
+
+def state(game):
+    players = tuple((bytes(p.hand), p._hand_size, tuple(p.tokens), p.final_score)
+                    for p in (game._player1, game._player2))
+    return (bytes(game.market), game.market_size, bytes(game.tokens_left), game.empty_stacks,
+            bytes(game._deck), game.deck_size, tuple(bytes(i) for i in game._bonus), bytes(game.bonus_left),
+            players, game.winner, game.player_turn.tag, game.zobrist)
+
+
+def test_undo_restores_every_action():
+    for game in positions():
+        before = state(game)
+        for action in game.player_turn.get_all_actions():
+            record = game.apply(action)
+            game.undo(record)
+            assert state(game) == before, action
+
+
+def test_undo_restores_move_sequences():
+    rng = random.Random(1)
+    for game in positions(range(4)):
+        before = state(game)
+        records = []
+        while game.winner is None and len(records) < 12:
+            records.append(game.apply(rng.choice(game.player_turn.get_all_actions())))
+        for record in reversed(records):
+            game.undo(record)
+        assert state(game) == before
+
+
+def test_zobrist_matches_full_hash():
+    for game in positions():
+        assert game.zobrist == game.compute_zobrist()
+        for action in game.player_turn.get_all_actions():
+            record = game.apply(action)
+            assert game.zobrist == game.compute_zobrist(), action
+            game.undo(record)
@@ -0,0 +1,31 @@
+import numpy as np
+
+from jaipur import *
+from player import *
+from evaluate import *
+
+
+def test_child_features_match_applied_states():
+    for seed in range(6):
+        game = Jaipur(lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                      lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                      muted=True, seed=seed)
+        while game.winner is None:
+            player = game.player_turn
+            ids = legal_ids(player.hand, game.market)
+            features = child_features(game, ids)
+
+            for action_id, row in zip(ids, features):
+                record = game.apply(ACTION_SPACE[action_id])
+                expected = np.zeros(N_FEATURES, dtype=np.int16)
+                expected[F_SCORE] = player.score()
+                expected[F_DECK_SIZE] = game.deck_size
+                expected[F_HAND_SIZE] = player.hand_size()
+                expected[F_HAND] = np.frombuffer(player.hand, dtype=np.uint8)
+                expected[F_MARKET] = np.frombuffer(game.market, dtype=np.uint8)
+                expected[F_TOKENS_LEFT] = np.frombuffer(game.tokens_left, dtype=np.uint8)
+                game.undo(record)
+                assert (row == expected).all(), ACTION_SPACE[action_id]
+
+            game = game.switch_player()
+            game.game_winner()
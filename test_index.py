@@ -0,0 +1,38 @@
+import random
+
+from records import *
+from index import *
+from test_records import state, play_recorded
+
+
+def test_keyframe_positions_match_live_games(tmp_path):
+    path = str(tmp_path / 'games.jpr')
+    with GameWriter(path) as writer:
+        played = play_recorded(writer, range(6))
+    index = GameIndex.build(path, interval=4)
+    assert len(index) == len(played)
+
+    rng = random.Random(0)
+    for g, (game, states) in enumerate(played):
+        assert index.plies(g) == len(states) - 1
+        plies = [0, 3, 4, 5, len(states) - 1] + [rng.randrange(len(states)) for i in range(10)]
+        for k in plies:
+            assert state(index.position(g, k)) == states[k], (g, k)
+    index.close()
+
+
+def test_build_extends_the_index(tmp_path):
+    path = str(tmp_path / 'games.jpr')
+    with GameWriter(path) as writer:
+        played = play_recorded(writer, range(3))
+    GameIndex.build(path, interval=4).close()
+    with GameWriter(path) as writer:
+        played += play_recorded(writer, range(3, 5))
+
+    index = GameIndex.build(path, interval=4)
+    assert len(index) == len(played)
+    rng = random.Random(1)
+    for g, (game, states) in enumerate(played):
+        k = rng.randrange(len(states))
+        assert state(index.position(g, k)) == states[k], (g, k)
+    index.close()
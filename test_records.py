@@ -0,0 +1,56 @@
+from jaipur import *
+from player import *
+from records import *
+
+
+def state(game):
+    # What a replay must reproduce: everything but the token lists, which keep only scores
+    return (bytes(game.market), game.market_size, bytes(game._player1.hand), bytes(game._player2.hand),
+            bytes(game.tokens_left), bytes(game.bonus_left), game.deck_size, game.empty_stacks,
+            game.player_turn.tag, game._player1.score(), game._player2.score(), game.winner, game.zobrist)
+
+
+def play_recorded(writer, seeds):
+    # Plays seeded random games recorded by writer, returns the state before every ply and
+    # at the end of each game
+    states = []
+    for seed in seeds:
+        game = Jaipur(lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                      lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                      muted=True, seed=seed, listeners=[writer])
+        played = [state(game)]
+        while game.winner is None:
+            game = game.switch_player()
+            game.game_winner()
+            played.append(state(game))
+        states.append((game, played))
+    return states
+
+
+def test_encode_decode_every_action():
+    for action in ACTION_SPACE:
+        assert decode_ply(encode_ply(action)) == action
+
+
+def test_written_games_replay_exactly(tmp_path):
+    path = str(tmp_path / 'games.jpr')
+    with GameWriter(path) as writer:
+        played = play_recorded(writer, range(5))
+    with GameWriter(path) as writer:
+        played += play_recorded(writer, range(5, 8))
+
+    records = list(read_games(path))
+    assert len(records) == len(played)
+    for record, (game, states) in zip(records, played):
+        assert record.seed == game.seed
+        assert record.winner == (1 if game.winner == game._player1.tag else 2)
+        assert record.scores == (game._player1.final_score, game._player2.final_score)
+        assert len(record.plies) == len(states) - 1
+        assert [state(position) for position in replay(record)] == states
+
+    # Only whole games are read from a file cut short
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-3])
+    assert len(list(read_games(path))) == len(played) - 1
@@ -0,0 +1,36 @@
+from jaipur import *
+from player import *
+from search import *
+
+
+def play(strategy, seed, plies=20):
+    # Moves strategy picks for both seats over the first plies of a seeded game
+    game = Jaipur(lambda tag, game: Player(strategy, tag, game),
+                  lambda tag, game: Player(strategy, tag, game),
+                  muted=True, seed=seed)
+    moves = []
+    while game.winner is None and len(moves) < plies:
+        game = game.switch_player()
+        moves.append(game.opponent().last_action)
+        game.game_winner()
+    return moves
+
+
+def test_moves_do_not_depend_on_earlier_games():
+    fresh = [play(ExpectimaxPlayerStrategy(max_depth=2, time_ms=None), seed) for seed in range(3)]
+
+    strategy = ExpectimaxPlayerStrategy(max_depth=2, time_ms=None)
+    assert [play(strategy, seed) for seed in reversed(range(3))] == fresh[::-1]
+
+
+def test_chance_key_covers_deck_and_bonus_contents():
+    game = Jaipur(lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                  lambda tag, game: Player(RandomPlayerStrategy(), tag, game),
+                  muted=True, seed=0)
+    key = chance_key(game)
+    game._deck[:game.deck_size] = reversed(game._deck[:game.deck_size])
+    assert chance_key(game) == key
+
+    i = next(i for i in range(1, game.deck_size) if game._deck[i] != game._deck[0])
+    game._deck[0] = game._deck[i]
+    assert chance_key(game) != key
@@ -0,0 +1,28 @@
+import functools
+
+import numpy as np
+
+from jaipur import *
+from player import *
+from search import ExpectimaxPlayerStrategy
+from mcts import MCTSPlayerStrategy
+from tournament import *
+
+STRATEGIES = {
+    'mcts': functools.partial(MCTSPlayerStrategy, playouts=10),
+    'expectimax': functools.partial(ExpectimaxPlayerStrategy, max_depth=1, time_ms=None),
+    'random': RandomPlayerStrategy,
+}
+
+
+def test_results_do_not_depend_on_chunks_or_processes():
+    results = []
+    for processes, chunk_size in (1, 1), (1, 4), (2, 1), (2, 4):
+        result = Tournament(STRATEGIES, 4, seed=3, processes=processes, chunk_size=chunk_size).run()
+        results.append(result)
+
+    for result in results[1:]:
+        assert (result.games == results[0].games).all()
+        assert (result.wins == results[0].wins).all()
+        assert (result.scores == results[0].scores).all()
+        assert np.allclose(result.margin_sq_sum, results[0].margin_sq_sum)
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from values import *
+
+
+def random_keys(rng, n, distinct=300):
+    # Keys drawn from a small pool, so batches repeat keys; never 0
+    return rng.integers(1, distinct + 1, n).astype(np.uint64) * np.uint64(0x9e3779b97f4a7c15)
+
+
+def test_set_update_lookup_match_a_dict(tmp_path):
+    rng = np.random.default_rng(0)
+    table = ValueTable.create(str(tmp_path / 'values.npy'), 1024)
+    reference = {}
+
+    for step in range(40):
+        keys = random_keys(rng, 50)
+        values = rng.normal(size=50).astype(np.float32)
+        if step % 2 == 0:
+            table.set(keys, values)
+            for key, value in zip(keys.tolist(), values):
+                reference[key] = value
+        else:
+            # Repeated keys move by the mean of their deltas
+            table.update(keys, values)
+            deltas = {}
+            for key, delta in zip(keys.tolist(), values):
+                deltas.setdefault(key, []).append(delta)
+            for key, ds in deltas.items():
+                reference[key] = reference.get(key, 0.0) + np.float32(np.mean(ds))
+
+        probe = np.concatenate([random_keys(rng, 50), np.array([12345], dtype=np.uint64)])
+        expected = [reference.get(key, -7.0) for key in probe.tolist()]
+        assert np.allclose(table.lookup(probe, default=-7.0), expected, atol=1e-5)
+        assert len(table) == len(reference)
+
+    keys, values = table.items()
+    assert sorted(keys.tolist()) == sorted(reference)
+    assert table.get(int(keys[0])) == pytest.approx(reference[int(keys[0])], abs=1e-5)
+    assert table.get(12345) is None
+
+
+def test_update_uses_the_mean_of_repeated_keys(tmp_path):
+    table = ValueTable.create(str(tmp_path / 'values.npy'), 1024)
+    table.update([5, 7, 5, 5], [1.0, 2.0, 3.0, -1.0])
+    assert table.lookup([5, 7]).tolist() == [1.0, 2.0]
+    table.update([5, 5], [1.0, 3.0])
+    assert table.lookup([5]).tolist() == [3.0]
+    assert table.entries['count'][table.slots([5, 7])].tolist() == [5, 1]
+
+
+def test_claim_gives_each_key_one_slot(tmp_path):
+    table = ValueTable.create(str(tmp_path / 'values.npy'), 1024)
+    keys = random_keys(np.random.default_rng(1), 500)
+    slots = table.claim(keys, np.arange(500, dtype=np.float32))
+    assert (table.slots(keys) == slots).all()
+    assert len(np.unique(slots)) == len(np.unique(keys)) == len(table)
+    # New keys start with the value of their last occurrence
+    last = {key: value for key, value in zip(keys.tolist(), range(500))}
+    assert table.lookup(keys).tolist() == [last[key] for key in keys.tolist()]
+
+
+def test_full_table_raises(tmp_path):
+    table = ValueTable.create(str(tmp_path / 'values.npy'), 1024)
+    # MAX_LOAD of 1024 slots is 921 keys
+    table.set(np.arange(1, 922, dtype=np.uint64), np.ones(921))
+    with pytest.raises(ValueError):
+        table.set([5000], [1.0])
+    with pytest.raises(ValueError):
+        table.update([5000, 5001], [1.0, 1.0])
+    with pytest.raises(ValueError):
+        table.insert(5000)
+    assert len(table) == 921
+    table.update([1, 2], [1.0, 1.0])
+    assert table.lookup([1, 2]).tolist() == [2.0, 2.0]
+
+
+def test_read_only_table_rejects_writes(tmp_path):
+    path = str(tmp_path / 'values.npy')
+    table = ValueTable.create(path, 1024)
+    table.set([1, 2], [1.0, 2.0])
+    table.flush()
+
+    table = ValueTable(path)
+    assert table.lookup([1, 2]).tolist() == [1.0, 2.0]
+    for write in (lambda: table.set([3], [1.0]), lambda: table.set([1], [5.0]),
+                  lambda: table.update([3], [1.0]), lambda: table.update([1], [1.0]),
+                  lambda: table.insert(3)):
+        with pytest.raises(ValueError):
+            write()
+    assert table.lookup([1, 2, 3]).tolist() == [1.0, 2.0, 0.0]
+
+
+def test_sharded_table_matches_a_dict(tmp_path):
+    rng = np.random.default_rng(2)
+    prefix = str(tmp_path / 'sharded')
+    table = ShardedValueTable.create(prefix, 4, 256)
+    reference = {}
+    for step in range(10):
+        keys = random_keys(rng, 40)
+        deltas = rng.normal(size=40).astype(np.float32)
+        table.update(keys, deltas)
+        groups = {}
+        for key, delta in zip(keys.tolist(), deltas):
+            groups.setdefault(key, []).append(delta)
+        for key, ds in groups.items():
+            reference[key] = reference.get(key, 0.0) + np.float32(np.mean(ds))
+    table.flush()
+
+    reopened = ShardedValueTable(prefix, 4)
+    keys = np.array(sorted(reference), dtype=np.uint64)
+    assert np.allclose(reopened.lookup(keys), [reference[key] for key in keys.tolist()], atol=1e-5)
+    assert len(reopened) == len(reference)
+    assert sum(len(shard) for shard in reopened.shards) == len(reference)
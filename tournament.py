@@ -0,0 +1,145 @@
+from multiprocessing import Pool
+
+import numpy as np
+
+from jaipur import *
+from player import *
+
+
+def play_chunk(unit):
+    # Plays one work unit: `count` games between two strategies, alternating seats.
+    # Strategies are built from their factories for every game, so nothing they keep
+    # (generators, search tables, trees) carries over from one game to the next and a
+    # game plays out the same whatever unit it lands in.
+    factories, i, j, first_game, count, seed = unit
+
+    wins = {i: 0, j: 0}
+    scores = {i: 0, j: 0}
+    margins = []
+
+    for g in range(first_game, first_game + count):
+        g_seed = game_seed(seed, g)
+        seats = (i, j) if g % 2 == 0 else (j, i)
+        strategies = {i: factories[i](), j: factories[j]()}
+
+        game = Jaipur(lambda tag, game: Player(strategies[seats[0]], tag, game),
+                      lambda tag, game: Player(strategies[seats[1]], tag, game),
+                      muted=True, seed=g_seed)
+        # Same loop as Jaipur.play_game without the banners
+        while game.winner is None:
+            game = game.switch_player()
+            game.game_winner()
+
+        winner = seats[0] if game.winner == game._player1.tag else seats[1]
+        wins[winner] += 1
+
+        final = {seats[0]: game._player1.final_score, seats[1]: game._player2.final_score}
+        scores[i] += final[i]
+        scores[j] += final[j]
+        margins.append(final[i] - final[j])
+
+    margins = np.array(margins, dtype=np.float64)
+    return i, j, count, wins[i], wins[j], scores[i], scores[j], margins.sum(), (margins ** 2).sum()
+
+
+class TournamentResult:
+    # Row strategy against column strategy, accumulated from work unit results
+
+    def __init__(self, names):
+        self.names = list(names)
+        k = len(self.names)
+        self.games = np.zeros((k, k), dtype=np.int64)
+        self.wins = np.zeros((k, k), dtype=np.int64)
+        self.scores = np.zeros((k, k), dtype=np.int64)
+        self.margin_sum = np.zeros((k, k))
+        self.margin_sq_sum = np.zeros((k, k))
+
+    def add(self, chunk):
+        i, j, count, wins_i, wins_j, score_i, score_j, margin_sum, margin_sq_sum = chunk
+        for a, b, won, score, sign in (i, j, wins_i, score_i, 1), (j, i, wins_j, score_j, -1):
+            self.games[a, b] += count
+            self.wins[a, b] += won
+            self.scores[a, b] += score
+            self.margin_sum[a, b] += sign * margin_sum
+            self.margin_sq_sum[a, b] += margin_sq_sum
+
+    def win_rate(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.wins / self.games
+
+    def win_rate_interval(self, z=1.96):
+        # Wilson score interval
+        n = self.games.astype(np.float64)
+        p = self.win_rate()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+            half = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return centre - half, centre + half
+
+    def mean_score(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.scores / self.games
+
+    def mean_margin(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.margin_sum / self.games
+
+    def margin_interval(self, z=1.96):
+        n = self.games.astype(np.float64)
+        mean = self.mean_margin()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = np.maximum(self.margin_sq_sum / n - mean ** 2, 0) * n / (n - 1)
+            half = z * np.sqrt(var / n)
+        return mean - half, mean + half
+
+    def print_summary(self):
+        rate = self.win_rate()
+        low, high = self.win_rate_interval()
+        margin = self.mean_margin()
+        for a, name in enumerate(self.names):
+            for b, other in enumerate(self.names):
+                if self.games[a, b]:
+                    print('%s vs %s: %d games, win rate %.3f [%.3f, %.3f], mean margin %+.1f' %
+                          (name, other, self.games[a, b], rate[a, b], low[a, b], high[a, b], margin[a, b]))
+
+
+class Tournament:
+    # Round robin between PlayerStrategy factories, `games` games per pairing split evenly
+    # between seats. Factories must be picklable (classes, functools.partial, module functions)
+    # since games are played in a process pool.
+
+    def __init__(self, strategies, games, seed=0, processes=None, chunk_size=50):
+        self.strategies = dict(strategies)
+        self.games = games
+        self.seed = seed
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+    def work_units(self):
+        factories = list(self.strategies.values())
+        pairing = 0
+        for i in range(len(factories)):
+            for j in range(i + 1, len(factories)):
+                # Each pairing owns its own block of game numbers so seeds never overlap
+                first = pairing * self.games
+                for start in range(0, self.games, self.chunk_size):
+                    count = min(self.chunk_size, self.games - start)
+                    yield factories, i, j, first + start, count, self.seed
+                pairing += 1
+
+    def results(self):
+        # Streams work unit results as they finish
+        if self.processes == 1:
+            yield from map(play_chunk, self.work_units())
+            return
+
+        with Pool(self.processes) as pool:
+            yield from pool.imap_unordered(play_chunk, self.work_units())
+
+    def run(self, callback=None):
+        result = TournamentResult(self.strategies)
+        for chunk in self.results():
+            result.add(chunk)
+            if callback is not None:
+                callback(result)
+        return result
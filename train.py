@@ -0,0 +1,172 @@
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from jaipur import *
+from player import *
+from values import *
+
+
+class ValuePlayerStrategy(PlayerStrategy):
+    # One-ply greedy agent in the style of old/agent_jaipur.py Agent: plays every action in
+    # place, looks up the value of the resulting state in a value table and picks the best,
+    # exploring with probability epsilon. Unknown states are worth `default`. Random choices
+    # come from the game's generator, so a seeded game plays out the same every time.
+
+    def __init__(self, table, epsilon=0.0, default=0.0):
+        self.table = table
+        self.epsilon = epsilon
+        self.default = default
+
+    def choose_action(self, player):
+        all_actions = player.get_all_actions()
+        game = player._game
+        if game.rng.random() < self.epsilon:
+            return game.rng.choice(all_actions)
+
+        muted, game.muted = game.muted, True
+        keys = []
+        for action in all_actions:
+            record = game.apply(action)
+            keys.append(state_key(player))
+            game.undo(record)
+        game.muted = muted
+
+        values = self.table.lookup(keys, self.default)
+        return all_actions[game.rng.choice(np.flatnonzero(values == values.max()))]
+
+
+def td_deltas(values, reward, alpha, lam):
+    # TD(lambda) updates for the states a player went through, rewarded only at the end:
+    # G_T-1 = reward, G_t = (1 - lam) * V(s_t+1) + lam * G_t+1. lam=0 is TD(0).
+    targets = np.empty_like(values)
+    g = reward
+    for t in range(len(values) - 1, -1, -1):
+        targets[t] = g
+        g = (1 - lam) * values[t] + lam * g
+    return alpha * (targets - values)
+
+
+# Value table of a worker process, opened read-only by open_worker_table
+_table = None
+
+
+def open_worker_table(prefix, shards):
+    global _table
+    _table = ShardedValueTable(prefix, shards)
+
+
+def play_episodes(unit):
+    # Worker: self-play games against the shared table, returns (keys, deltas) ready to merge
+    first, episodes, seed, epsilon, alpha, lam = unit
+    strategy = ValuePlayerStrategy(_table, epsilon)
+
+    keys = []
+    deltas = []
+    for i in range(first, first + episodes):
+        game = Jaipur(lambda tag, game: Player(strategy, tag, game),
+                      lambda tag, game: Player(strategy, tag, game),
+                      muted=True, seed=game_seed(seed, i))
+        visited = {game._player1.tag: [], game._player2.tag: []}
+        while game.winner is None:
+            player = game.player_turn
+            game = game.switch_player()
+            visited[player.tag].append(state_key(player))
+            game.game_winner()
+
+        for tag, states in visited.items():
+            states = np.array(states, dtype=np.uint64)
+            reward = 1.0 if game.winner == tag else -1.0
+            keys.append(states)
+            deltas.append(td_deltas(_table.lookup(states), reward, alpha, lam))
+
+    return np.concatenate(keys), np.concatenate(deltas)
+
+
+class Trainer:
+    # Self-play TD training on a process pool. Workers map the shards read-only, play
+    # `unit_size` episodes per work unit against the live values and send back TD(lambda)
+    # updates. This process buffers them and merges them into the shards every
+    # `merge_every` episodes (workers see merged values through the shared mapping), and
+    # checkpoints (flushes the shards and writes prefix.json) every `checkpoint_every`.
+
+    def __init__(self, prefix, shards=8, capacity=1 << 22, processes=None, unit_size=50,
+                 epsilon=0.2, alpha=0.1, lam=0.0, merge_every=1000, checkpoint_every=10000, seed=0):
+        self.prefix = prefix
+        self.shards = shards
+        self.capacity = capacity
+        self.processes = processes
+        self.unit_size = unit_size
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.lam = lam
+        self.merge_every = merge_every
+        self.checkpoint_every = checkpoint_every
+        self.seed = seed
+        self.episodes = 0
+
+        if os.path.exists(prefix + '.json'):
+            with open(prefix + '.json') as f:
+                self.episodes = json.load(f)['episodes']
+            self.table = ShardedValueTable(prefix, shards, 'r+')
+        else:
+            self.table = ShardedValueTable.create(prefix, shards, capacity)
+
+    def work_units(self, episodes):
+        for first in range(0, episodes, self.unit_size):
+            count = min(self.unit_size, episodes - first)
+            yield self.episodes + first, count, self.seed, self.epsilon, self.alpha, self.lam
+
+    def train(self, episodes, callback=None):
+        keys = []
+        deltas = []
+        buffered = 0
+        next_checkpoint = self.episodes + self.checkpoint_every
+
+        units = list(self.work_units(episodes))
+        with Pool(self.processes, initializer=open_worker_table, initargs=(self.prefix, self.shards)) as pool:
+            for unit, (unit_keys, unit_deltas) in zip(units, pool.imap(play_episodes, units)):
+                keys.append(unit_keys)
+                deltas.append(unit_deltas)
+                buffered += unit[1]
+                self.episodes += unit[1]
+
+                if buffered >= self.merge_every:
+                    self.merge(keys, deltas)
+                    keys, deltas, buffered = [], [], 0
+
+                if self.episodes >= next_checkpoint:
+                    self.merge(keys, deltas)
+                    keys, deltas, buffered = [], [], 0
+                    self.checkpoint()
+                    next_checkpoint += self.checkpoint_every
+
+                if callback is not None:
+                    callback(self)
+
+        self.merge(keys, deltas)
+        self.checkpoint()
+
+    def merge(self, keys, deltas):
+        if keys:
+            self.table.update(np.concatenate(keys), np.concatenate(deltas))
+
+    def checkpoint(self):
+        self.table.flush()
+        with open(self.prefix + '.json', 'w') as f:
+            json.dump({'episodes': self.episodes, 'shards': self.shards, 'states': len(self.table),
+                       'alpha': self.alpha, 'lam': self.lam, 'epsilon': self.epsilon, 'time': time.time()}, f)
+
+
+if __name__ == "__main__":
+    # python train.py prefix episodes [lam]
+    trainer = Trainer(sys.argv[1], lam=float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)
+    start = time.time()
+    trainer.train(int(sys.argv[2]),
+                  lambda t: print('\r%d episodes, %d states, %.0f episodes/s'
+                                  % (t.episodes, len(t.table), t.episodes / (time.time() - start)), end=''))
+    print()
@@ -0,0 +1,299 @@
+import pickle
+import sys
+
+import numpy as np
+
+from jaipur import *
+
+ENTRY = np.dtype([('key', '<u8'), ('value', '<f4'), ('count', '<u4')])
+MAX_LOAD = 0.9
+
+
+def pack_state(score, deck_size, hand_size, hand, camels, market):
+    # Packs the learning state of old/agent_jaipur.py Player.get_state into one integer,
+    # exactly (no collisions). 0 is never returned, it marks empty slots in a ValueTable.
+    key = min(score // 5, 63)
+    key = key << 4 | deck_size // 5
+    key = key << 4 | min(hand_size, 15)
+    for i in GOODS:
+        key = key << 4 | hand[i]
+    key = key << 4 | camels
+    for i in COMMODITIES:
+        key = key << 3 | market[i]
+    return key + 1
+
+
+def pack_states(scores, deck_sizes, hand_sizes, hands, markets):
+    # pack_state of m states at once: (m,) scores, deck and hand sizes, (m, N_COMMODITIES)
+    # hands (camels included) and markets, as a uint64 array
+    key = np.minimum(np.asarray(scores) // 5, 63).astype(np.uint64)
+    key = key << np.uint64(4) | (np.asarray(deck_sizes) // 5).astype(np.uint64)
+    key = key << np.uint64(4) | np.minimum(hand_sizes, 15).astype(np.uint64)
+    hands = np.asarray(hands).astype(np.uint64)
+    markets = np.asarray(markets).astype(np.uint64)
+    for i in GOODS:
+        key = key << np.uint64(4) | hands[:, i]
+    key = key << np.uint64(4) | hands[:, Commodity.CAMEL]
+    for i in COMMODITIES:
+        key = key << np.uint64(3) | markets[:, i]
+    return key + np.uint64(1)
+
+
+def state_key(player):
+    game = player._game
+    return pack_state(player.score(), game.deck_size, player.hand_size(), player.hand,
+                      player.camel_count, game.market)
+
+
+def old_state_key(state):
+    # Key of a state tuple from old/agent_jaipur.py Player.get_state
+    score, deck_size, hand_size, hand, camel, market = state
+    return pack_state(score * 5, deck_size * 5, hand_size, hand, camel, market)
+
+
+def mix(keys):
+    # splitmix64 finalizer, spreads packed keys over the table
+    keys = np.asarray(keys, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return keys ^ (keys >> np.uint64(31))
+
+
+class ValueTable:
+    # Open addressing (linear probing) hash table of packed state keys to values, stored as
+    # a .npy file and used through np.memmap, so opening it does not read it and any number
+    # of processes can map the same file read-only and share its pages.
+    # Writers store the value of a new entry before its key (see claim), so concurrent
+    # readers never find a key without its value. Values of keys already in the table are
+    # changed in place, readers get the old or the new one.
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.entries = np.load(path, mmap_mode=mode)
+        self.capacity = len(self.entries)
+        self.mask = np.uint64(self.capacity - 1)
+        self.writable = mode != 'r'
+        self._size = None
+
+    @classmethod
+    def create(cls, path, capacity):
+        if capacity & (capacity - 1):
+            raise ValueError('capacity must be a power of two')
+        entries = np.lib.format.open_memmap(path, mode='w+', dtype=ENTRY, shape=(capacity,))
+        entries.flush()
+        del entries
+        return cls(path, 'r+')
+
+    @classmethod
+    def from_dict(cls, path, state_values, capacity=None):
+        # Converts a pickled state_values dict of old/agent_jaipur.py
+        capacity = capacity or 1 << max(10, int(len(state_values) / MAX_LOAD * 2).bit_length())
+        table = cls.create(path, capacity)
+        keys = np.fromiter((old_state_key(i) for i in state_values), dtype=np.uint64, count=len(state_values))
+        values = np.fromiter(state_values.values(), dtype=np.float32, count=len(state_values))
+        table.set(keys, values)
+        table.flush()
+        return table
+
+    def __len__(self):
+        if self._size is None:
+            self._size = int(np.count_nonzero(self.entries['key']))
+        return self._size
+
+    def slots(self, keys):
+        # Slot of each key, -1 where the key is not in the table
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.uint64))
+        slot = (mix(keys) & self.mask).astype(np.int64)
+        found = np.full(len(keys), -1, dtype=np.int64)
+
+        table_keys = self.entries['key']
+        pending = np.arange(len(keys))
+        while len(pending):
+            stored = table_keys[slot[pending]]
+            hit = stored == keys[pending]
+            found[pending[hit]] = slot[pending[hit]]
+
+            pending = pending[~hit & (stored != 0)]
+            slot[pending] = (slot[pending] + 1) & int(self.mask)
+        return found
+
+    def lookup(self, keys, default=0.0):
+        slots = self.slots(keys)
+        values = np.full(len(slots), default, dtype=np.float32)
+        known = slots >= 0
+        values[known] = self.entries['value'][slots[known]]
+        return values
+
+    def get(self, key, default=None):
+        slot = self.slots(key)[0]
+        return default if slot < 0 else float(self.entries['value'][slot])
+
+    def insert(self, key, value=0.0):
+        # Slot of key, claiming an empty one with value if needed
+        if not self.writable:
+            raise ValueError('table is opened read-only')
+
+        table_keys = self.entries['key']
+        key = np.uint64(key)
+        slot = int(mix(key) & self.mask)
+        while True:
+            stored = table_keys[slot]
+            if stored == key:
+                return slot
+            if stored == 0:
+                break
+            slot = (slot + 1) & int(self.mask)
+
+        if len(self) + 1 > MAX_LOAD * self.capacity:
+            raise ValueError('value table is full')
+        self.entries['value'][slot] = value
+        self.entries['count'][slot] = 0
+        table_keys[slot] = key
+        self._size += 1
+        return slot
+
+    def claim(self, keys, values=None):
+        # Slots of keys, inserting the missing ones with their values (0 without values, the
+        # last one for a key given several times). Missing keys probe in lockstep and when
+        # several reach the same empty slot the first one takes it.
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.uint64))
+        slots = self.slots(keys)
+        missing = slots < 0
+        if not missing.any():
+            return slots
+
+        if not self.writable:
+            raise ValueError('table is opened read-only')
+        new, inverse = np.unique(keys[missing], return_inverse=True)
+        inverse = inverse.ravel()
+        if len(self) + len(new) > MAX_LOAD * self.capacity:
+            raise ValueError('value table is full')
+        initial = np.zeros(len(new), dtype=np.float32)
+        if values is not None:
+            initial[inverse] = np.broadcast_to(np.asarray(values, dtype=np.float32), keys.shape)[missing]
+
+        table_keys = self.entries['key']
+        slot = (mix(new) & self.mask).astype(np.int64)
+        pending = np.arange(len(new))
+        while len(pending):
+            free = pending[table_keys[slot[pending]] == 0]
+            claimed, first = np.unique(slot[free], return_index=True)
+            winners = free[first]
+
+            self.entries['value'][claimed] = initial[winners]
+            self.entries['count'][claimed] = 0
+            table_keys[claimed] = new[winners]
+
+            pending = np.setdiff1d(pending, winners, assume_unique=True)
+            slot[pending] = (slot[pending] + 1) & int(self.mask)
+
+        self._size += len(new)
+        slots[missing] = slot[inverse]
+        return slots
+
+    def set(self, keys, values):
+        slots = self.claim(keys, values)
+        self.entries['value'][slots] = values
+        self.entries['count'][slots] += 1
+
+    def update(self, keys, deltas):
+        # Adds to the value of each key the mean of its deltas: the deltas of one batch were
+        # all computed against the same stale values, so summing repeated keys would step
+        # them several times too far. Counts still go up by one per delta. New keys are
+        # claimed with their mean delta as value.
+        keys, inverse = np.unique(np.atleast_1d(np.asarray(keys, dtype=np.uint64)), return_inverse=True)
+        inverse = inverse.ravel()
+        n = np.bincount(inverse, minlength=len(keys))
+        total = np.bincount(inverse, weights=np.asarray(deltas, dtype=np.float64), minlength=len(keys))
+        mean = (total / n).astype(np.float32)
+
+        slots = self.slots(keys)
+        known = slots >= 0
+        self.entries['value'][slots[known]] += mean[known]
+        if not known.all():
+            slots[~known] = self.claim(keys[~known], mean[~known])
+        self.entries['count'][slots] += n.astype(np.uint32)
+
+    def items(self):
+        used = self.entries[self.entries['key'] != 0]
+        return used['key'], used['value']
+
+    def flush(self):
+        if self.writable:
+            self.entries.flush()
+
+
+class ShardedValueTable:
+    # Several ValueTables (prefix-0.npy, prefix-1.npy, ...) with keys spread by the high bits
+    # of their mix, so each shard can be updated and flushed on its own
+
+    def __init__(self, prefix, shards, mode='r'):
+        self.prefix = prefix
+        self.shards = [ValueTable(self.shard_path(prefix, i), mode) for i in range(shards)]
+
+    @staticmethod
+    def shard_path(prefix, i):
+        return '%s-%d.npy' % (prefix, i)
+
+    @classmethod
+    def create(cls, prefix, shards, capacity):
+        for i in range(shards):
+            ValueTable.create(cls.shard_path(prefix, i), capacity)
+        return cls(prefix, shards, 'r+')
+
+    def __len__(self):
+        return sum(len(i) for i in self.shards)
+
+    def split(self, keys):
+        # Shard number of each key
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.uint64))
+        return (mix(keys) >> np.uint64(40)) % np.uint64(len(self.shards))
+
+    def lookup(self, keys, default=0.0):
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.uint64))
+        shard = self.split(keys)
+        values = np.empty(len(keys), dtype=np.float32)
+        for i, table in enumerate(self.shards):
+            mine = shard == i
+            if mine.any():
+                values[mine] = table.lookup(keys[mine], default)
+        return values
+
+    def get(self, key, default=None):
+        return self.shards[int(self.split(key)[0])].get(key, default)
+
+    def update(self, keys, deltas):
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.uint64))
+        deltas = np.asarray(deltas, dtype=np.float32)
+        shard = self.split(keys)
+        for i, table in enumerate(self.shards):
+            mine = shard == i
+            if mine.any():
+                table.update(keys[mine], deltas[mine])
+
+    def flush(self):
+        for i in self.shards:
+            i.flush()
+
+
+if __name__ == "__main__":
+    # python values.py convert state_values.pickle state_values.npy
+    # python values.py show state_values.npy
+    if sys.argv[1] == 'convert':
+        with open(sys.argv[2], 'rb') as f:
+            table = ValueTable.from_dict(sys.argv[3], pickle.load(f))
+        print(len(table), 'states in', table.capacity, 'slots')
+
+    elif sys.argv[1] == 'show':
+        table = ValueTable(sys.argv[2])
+        keys, values = table.items()
+        print(len(keys))
+        print(np.count_nonzero(values))
+
+        order = np.argsort(values)
+        for i in order[:20]:
+            print(keys[i], values[i])
+        print()
+        for i in order[-20:]:
+            print(keys[i], values[i])